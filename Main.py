@@ -1,8 +1,13 @@
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import sys
 
 from scripts import RESOURCES_PATH
+from scripts.funs.FftBackend import FftBackend
+from scripts.funs.PsTopofit import PsTopofit
 from scripts.processes.CreateLonLat import CreateLonLat
 from scripts.processes.PhaseCorrection import PhaseCorrection
 from scripts.processes.PsEstGamma import PsEstGamma
@@ -10,6 +15,8 @@ from scripts.processes.PsFiles import PsFiles
 from scripts.processes.PsSelect import PsSelect
 from scripts.processes.PsWeed import PsWeed
 from scripts.utils.internal.ConfigUtils import ConfigUtils
+from scripts.utils.internal.DataTypes import DataTypes
+from scripts.utils.internal.FolderConstants import FolderConstants
 from scripts.utils.internal.LoggerFactory import LoggerFactory
 from scripts.utils.internal.ProcessHandler import ProcessHandler
 
@@ -17,10 +24,14 @@ from scripts.utils.internal.ProcessHandler import ProcessHandler
 class Main:
     processes = [CreateLonLat, PsFiles, PsEstGamma, PsSelect, PsWeed, PhaseCorrection]
 
+    # PATCH folders are named like PATCH_1, PATCH_2, ...
+    __PATCH_FOLDER_REGEX = re.compile(r"^PATCH_(\d+)$")
+
     def __init__(self) -> None:
         self.__logger = LoggerFactory.create("Main")
 
-        self.__process_factory = self.__make_process_factory()
+        self.__handler_params, self.__patch_workers = self.__get_from_config()
+        self.__patch_folders = self.__find_patch_folders(self.__handler_params['path'])
 
     def run(self, start=0, end=8):
         """
@@ -30,40 +41,24 @@ class Main:
         You can run one process at the time when you set start and end to equal value
         (:e.g. run(0, 0)).
 
+        Every PATCH folder is processed separately. When patch_workers in configuration is more
+        than one then patches are processed in parallel in separate processes.
+
         :param start: step index where to start processing
         :param end: step index where to end processing
-        :return: saves result(s) to save_load_path that is configuration
+        :return: saves result(s) to save_load_path/<PATCH folder> that is configuration
         """
 
-        step = -1
-        try:
-            for step in range(len(self.processes)):
-                if (step - 1) == end:
-                    break
-                elif step < start:
-                    self.__load_saved(step)
-                else:
-                    self.__start_process(step)
-        except Exception:
-            self.__logger.error("Main process run error", exc_info=True)
-            end = (step - 1)
-        finally:
-            self.__save_results(start, end)
-
-    def __load_saved(self, step: int):
-        self.__process_factory.load_results(self.processes[step])
-
-    def __start_process(self, step: int):
-        self.__process_factory.start_process(self.processes[step])
-
-    def __save_results(self, start: int, end: int):
-        for step in range(len(self.processes)):
-            if step < start:
-                continue
-            elif (step - 1) == end:
-                break
-            elif step >= start:
-                self.__process_factory.save_process(self.processes[step])
+        workers = min(self.__patch_workers, len(self.__patch_folders))
+        self.__logger.info("Patches {0}, workers {1}".format(self.__patch_folders, workers))
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(run_patch, repeat(self.__handler_params), self.__patch_folders,
+                                  repeat(start), repeat(end)))
+        else:
+            for patch_folder in self.__patch_folders:
+                run_patch(self.__handler_params, patch_folder, start, end)
 
     def __assert_params(self, start: int, stop: int):
         if start < 0:
@@ -72,12 +67,26 @@ class Main:
             raise AttributeError(
                 "Stop more than than {0} or len(self.processes)".format(len(self.processes)))
 
-    def __make_process_factory(self) -> ProcessHandler:
-        path, geo_file_path, save_load_path, rand_dist_cached = self.__get_from_config()
-        return ProcessHandler(path, geo_file_path, save_load_path, rand_dist_cached)
+    def __find_patch_folders(self, path: str) -> list:
+        """PATCH folders in path sorted by patch number. When there are none then
+        FolderConstants.PATCH_FOLDER_NAME is used and processes give error if it is missing"""
+
+        patch_folders = []
+        if os.path.isdir(path):
+            for folder in os.listdir(path):
+                match = self.__PATCH_FOLDER_REGEX.match(folder)
+                if match is not None and os.path.isdir(os.path.join(path, folder)):
+                    patch_folders.append((int(match.group(1)), folder))
+
+        if len(patch_folders) == 0:
+            self.__logger.info("No PATCH folders found in {0}".format(path))
+            return [FolderConstants.PATCH_FOLDER_NAME]
+
+        return [folder for _, folder in sorted(patch_folders)]
 
     # noinspection PyMethodMayBeStatic
-    def __get_from_config(self) -> (str, str, str, bool):
+    def __get_from_config(self) -> (dict, int):
+        """Returns ProcessHandler parameters as dict and number of patch workers"""
         self.__logger.info("Loading params form {0}".format(RESOURCES_PATH))
 
         config = ConfigUtils(RESOURCES_PATH)
@@ -93,10 +102,88 @@ class Main:
 
         rand_dist_cached = config.get_default_section('rand_dist_cached') == 'True'
 
-        self.__logger.info("Loaded params. path {0}, geo_file_path {1}, save_load_path {2},"
-                           " rand_dist_cached {3}".format(path, geo_file_path, save_load_path,
-                                                          rand_dist_cached))
-        return path, geo_file_path, save_load_path, rand_dist_cached
+        # Not mandatory. When empty CreateLonLat selects reader itself
+        geo_reader = config.get_default_section('geo_reader', '')
+
+        ps_files_out_of_core = config.get_default_section('ps_files_out_of_core',
+                                                          'False') == 'True'
+
+        patch_workers = int(config.get_default_section('patch_workers', '1'))
+
+        precision = config.get_default_section('precision', DataTypes.PRECISION_DOUBLE)
+
+        topofit_engine = config.get_default_section('topofit_engine', PsTopofit.ENGINE_NUMPY)
+
+        topofit_search = config.get_default_section('topofit_search',
+                                                    PsTopofit.SEARCH_EXHAUSTIVE)
+
+        rand_dist_size = int(config.get_default_section(
+            'rand_dist_size', str(PsEstGamma.DEFAULT_RAND_DIST_SIZE)))
+        # Not mandatory. When empty then all rand_dist_size random pixels are used
+        rand_dist_tolerance = config.get_default_section('rand_dist_tolerance', '')
+        rand_dist_tolerance = float(rand_dist_tolerance) if rand_dist_tolerance else None
+
+        # Not mandatory. When empty then in PsEstGamma all pixels topofit is found every iteration
+        topofit_refit_threshold = config.get_default_section('topofit_refit_threshold', '')
+        topofit_refit_threshold = float(topofit_refit_threshold) if topofit_refit_threshold \
+            else None
+
+        fft_backend = config.get_default_section('fft_backend', FftBackend.BACKEND_NUMPY)
+        fft_workers = int(config.get_default_section('fft_workers', '1'))
+        if fft_backend == FftBackend.BACKEND_FASTEST:
+            # Chosen once here, so that patch worker processes don't make benchmark again
+            fft_backend = FftBackend.get_fastest_backend(fft_workers)
+        clap_workers = int(config.get_default_section('clap_workers', '1'))
+
+        handler_params = dict(path=path, geo_file_path=geo_file_path,
+                              save_load_path=save_load_path, rand_dist_cached=rand_dist_cached,
+                              geo_reader=geo_reader, ps_files_out_of_core=ps_files_out_of_core,
+                              precision=precision, topofit_engine=topofit_engine,
+                              rand_dist_size=rand_dist_size,
+                              rand_dist_tolerance=rand_dist_tolerance,
+                              topofit_search=topofit_search,
+                              topofit_refit_threshold=topofit_refit_threshold,
+                              fft_backend=fft_backend, fft_workers=fft_workers,
+                              clap_workers=clap_workers)
+
+        self.__logger.info("Loaded params. {0}, patch_workers {1}".format(handler_params,
+                                                                          patch_workers))
+        return handler_params, patch_workers
+
+
+def run_patch(handler_params: dict, patch_folder_name: str, start: int, end: int):
+    """Runs processes from start to end for one PATCH folder. Results are saved to
+    save_load_path/patch_folder_name. This is module function so that it can be run in other
+    process (ProcessPoolExecutor)."""
+
+    logger = LoggerFactory.create("Main")
+    logger.info("Start patch {0}".format(patch_folder_name))
+
+    save_load_path = os.path.join(handler_params['save_load_path'], patch_folder_name)
+    process_handler = ProcessHandler(**dict(handler_params, save_load_path=save_load_path),
+                                     patch_folder_name=patch_folder_name)
+
+    step = -1
+    try:
+        for step in range(len(Main.processes)):
+            if (step - 1) == end:
+                break
+            elif step < start:
+                process_handler.load_results(Main.processes[step])
+            else:
+                process_handler.start_process(Main.processes[step])
+    except Exception:
+        logger.error("Main process run error. Patch {0}".format(patch_folder_name),
+                     exc_info=True)
+        end = (step - 1)
+    finally:
+        for step in range(len(Main.processes)):
+            if step < start:
+                continue
+            elif (step - 1) == end:
+                break
+            elif step >= start:
+                process_handler.save_process(Main.processes[step])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scripts.funs.FftBackend import FftBackend
+from scripts.utils.ArrayUtils import ArrayUtils
+from scripts.utils.MatlabUtils import MatlabUtils
+from scripts.utils.internal.DataTypes import DataTypes
+
+
+class ClapFilt:
+    """Combined Low-pass Adaptive Phase filtering (CLAP). In StaMPS these are clap_filt
+    (PsEstGamma, overlapping windows over whole grid) and clap_filt_patch (PsSelect, one window
+    around every pixel). Both use filter_windows that filters many windows at once.
+
+    Things that depend only on parameters are made once: smoothing kernel in constructor,
+    low-pass response in get_low_pass and window functions with grid indexes for every grid
+    shape in filter_grid.
+
+    In filter_grid blocks of interferograms can be filtered in parallel threads. Most of the
+    work is in FFT's and numpy functions that release GIL. Threads are made once and live as
+    long as ClapFilt (or until close), so FftBackend's per thread pyFFTW plans are reused"""
+
+    # In StaMPS smoothing kernel is gausswin(7) * gausswin(7)'
+    __SMOOTH_KERNEL_LEN = 7
+
+    # How many window elements are filtered at once in filter_grid (in every thread)
+    __BLOCK_ELEMENTS = 1 << 22
+
+    # Low-pass responses by clap_win, filter_grid_size and low_pass_wavelength
+    __low_pass_cache = {}
+
+    def __init__(self, clap_alpha: float, clap_beta: float, clap_win: int,
+                 precision: str = DataTypes.PRECISION_DOUBLE, fft_backend: FftBackend = None,
+                 workers: int = 1):
+        """precision = DataTypes.PRECISION_SINGLE or DataTypes.PRECISION_DOUBLE. Filtered windows
+        and grids are float32/ complex64 with single precision
+        fft_backend = FFT's in filtering. When None then numpy backend is used
+        workers = how many threads filter interferograms blocks in filter_grid"""
+        # Made in first parallel filter_grid (see __get_executor). First, because __del__ needs it
+        self.__executor = None
+
+        self.__clap_alpha = clap_alpha
+        self.__clap_beta = clap_beta
+        self.__clap_win = clap_win
+        self.__float_type = DataTypes.get_float_type(precision)
+        self.__complex_type = DataTypes.get_complex_type(precision)
+        self.__fft = fft_backend if fft_backend is not None else FftBackend()
+        self.__workers = workers
+
+        # 2D kernel is outer product of this, so smoothing is made with two 1D passes
+        self.__smooth_kernel = MatlabUtils.gausswin(self.__SMOOTH_KERNEL_LEN)
+
+        # Window functions and grid indexes by grid shape (see __get_grid_windows)
+        self.__grid_windows = {}
+
+    @staticmethod
+    def get_low_pass(clap_win: int, filter_grid_size: float,
+                     low_pass_wavelength: float) -> np.ndarray:
+        """Low-pass response (Butterworth) for clap_win x clap_win window. Array is read only,
+        because it is shared by all callers with same parameters"""
+        key = (clap_win, filter_grid_size, low_pass_wavelength)
+        if key not in ClapFilt.__low_pass_cache:
+            start = -clap_win / filter_grid_size / clap_win / 2
+            stop = (clap_win - 2) / filter_grid_size / clap_win / 2
+            step = 1 / filter_grid_size / clap_win
+            freg_i = ArrayUtils.arange_include_last(start, stop, step)
+
+            freg_0 = 1 / low_pass_wavelength
+
+            subtract = 1 + np.power(freg_i / freg_0, 10)
+            butter_i = np.divide(1, subtract)
+
+            low_pass = np.fft.fftshift(np.outer(butter_i.conj(), butter_i))
+            low_pass.flags.writeable = False
+            ClapFilt.__low_pass_cache[key] = low_pass
+
+        return ClapFilt.__low_pass_cache[key]
+
+    def filter_windows(self, windows: np.ndarray, low_pass: np.ndarray) -> np.ndarray:
+        """Filters every window in last two axes (..., n, n). low_pass is n x n response or empty
+        array when there is no low-pass (in StaMPS zeros)"""
+        FFT_AXES = (-2, -1)
+
+        if len(low_pass) == 0:
+            low_pass = 0
+
+        ph_fft = self.__fft.fft2(np.nan_to_num(windows), FFT_AXES)
+        smooth_resp = np.abs(ph_fft) # 'H' in Stamps
+        smooth_resp = np.fft.ifftshift(
+            self.__smooth(np.fft.fftshift(smooth_resp, axes=FFT_AXES)), axes=FFT_AXES)
+        median_smooth_resp = np.median(smooth_resp, axis=FFT_AXES, keepdims=True)
+
+        np.divide(smooth_resp, median_smooth_resp, out=smooth_resp,
+                  where=median_smooth_resp != 0)
+
+        smooth_resp = np.power(smooth_resp, self.__clap_alpha)
+
+        # todo Values under median to zero. Why that?
+        smooth_resp -= 1
+        smooth_resp[smooth_resp < 0] = 0
+
+        # todo What is G?
+        G = smooth_resp * self.__clap_beta + low_pass
+        del smooth_resp
+
+        return self.__fft.ifft2(np.multiply(ph_fft, G), FFT_AXES)
+
+    def filter_grid(self, ph: np.ndarray, low_pass: np.ndarray) -> np.ndarray:
+        """Filters grid of interferograms (nr_i, nr_j, nr_ifgs) with overlapping windows like
+        StaMPS clap_filt. Windows of interferograms in block are filtered at once and added back
+        to grid with window function in same order as in StaMPS loop"""
+        ph_i_len, ph_j_len, nr_ifgs = ph.shape
+        i_starts, j_starts, wind_func, grid_ind = self.__get_grid_windows(ph_i_len, ph_j_len)
+        nr_win = wind_func.shape[-1]
+        nr_win_pad_sum = len(low_pass)
+        nr_grid_values = ph_i_len * ph_j_len
+
+        # Interferograms first, so that every window is in last two axes
+        ph = np.ascontiguousarray(np.moveaxis(np.nan_to_num(ph), 2, 0), self.__complex_type)
+        filtered = np.zeros(ph.shape, self.__complex_type)
+
+        ifg_stride, i_stride, j_stride = ph.strides
+        # Strided view of all possible windows. Needed windows are selected from that
+        all_windows = np.lib.stride_tricks.as_strided(
+            ph, (nr_ifgs, ph_i_len - nr_win + 1, ph_j_len - nr_win + 1, nr_win, nr_win),
+            (ifg_stride, i_stride, j_stride, i_stride, j_stride), writeable=False)
+
+        def filter_block(block_start: int, block_end: int):
+            """Filters interferograms block_start:block_end. Every block writes only to its own
+            interferograms in filtered, so blocks can be filtered in parallel"""
+            nr_block_values = (block_end - block_start) * nr_grid_values
+
+            ph_bit = np.zeros((block_end - block_start,) + wind_func.shape[:2] +
+                              (nr_win_pad_sum, nr_win_pad_sum), self.__complex_type)
+            ph_bit[..., :nr_win, :nr_win] = all_windows[block_start:block_end,
+                                                        i_starts[:, np.newaxis],
+                                                        j_starts[np.newaxis, :]]
+
+            ph_filt = self.filter_windows(ph_bit, low_pass)
+            del ph_bit
+            ph_filt = np.multiply(ph_filt[..., :nr_win, :nr_win], wind_func)
+
+            # Overlap-add of all windows. Every interferogram has its own part in flattened array
+            value_ind = (np.arange(block_end - block_start)[:, np.newaxis] * nr_grid_values
+                         + grid_ind).ravel()
+            block_filtered = filtered[block_start:block_end].reshape(-1)
+            block_filtered.real = np.bincount(value_ind, ph_filt.real.ravel(), nr_block_values)
+            block_filtered.imag = np.bincount(value_ind, ph_filt.imag.ravel(), nr_block_values)
+
+        nr_block_ifgs = max(self.__BLOCK_ELEMENTS // (wind_func.size // (nr_win * nr_win)
+                                                      * nr_win_pad_sum * nr_win_pad_sum), 1)
+        # Every thread gets at least one block
+        nr_block_ifgs = min(nr_block_ifgs, int(np.ceil(nr_ifgs / self.__workers)))
+        block_starts = range(0, nr_ifgs, nr_block_ifgs)
+        block_ends = [min(block_start + nr_block_ifgs, nr_ifgs) for block_start in block_starts]
+
+        if self.__workers > 1 and len(block_starts) > 1:
+            # list() to get exceptions from threads
+            list(self.__get_executor().map(filter_block, block_starts, block_ends))
+        else:
+            for block_start, block_end in zip(block_starts, block_ends):
+                filter_block(block_start, block_end)
+
+        return np.moveaxis(filtered, 0, 2)
+
+    def close(self):
+        """Stops filter_grid threads. When filter_grid is called again then new threads are
+        made"""
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def __del__(self):
+        self.close()
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(self.__workers)
+
+        return self.__executor
+
+    def __get_grid_windows(self, ph_i_len: int, ph_j_len: int) -> tuple:
+        """Windows first indexes in both axes, shifted window function for every window
+        (nr_win_i, nr_win_j, nr_win, nr_win) and windows elements indexes in flattened
+        (nr_i, nr_j) grid. Made once for every grid shape"""
+
+        def create_grid(nr_win: int):
+            grid_array = ArrayUtils.arange_include_last(0, (nr_win / 2) - 1)
+            grid_x, grid_y = np.meshgrid(grid_array, grid_array)
+            grid = grid_x + grid_y
+
+            return grid
+
+        # todo What does wind_func mean? This isn't array of functions
+        def make_wind_func(grid: np.ndarray):
+            WIND_FUNC_TYPE = self.__float_type
+            wind_func = np.array(np.append(grid, np.fliplr(grid), axis=1), WIND_FUNC_TYPE)
+            wind_func = np.array(np.append(wind_func, np.flipud(wind_func), axis=0), WIND_FUNC_TYPE)
+            # In order to prevent zeros in corners
+            wind_func += 1e-6
+
+            return wind_func
+
+        def get_window_starts(ph_len: int, nr_windows: int) -> (np.ndarray, np.ndarray):
+            """Windows first indexes and window function shifts. Windows that don't fit into
+            grid are moved back inside and window function is shifted by the same amount, so
+            that rows/ columns outside of grid get zero weight"""
+            starts = np.arange(nr_windows) * nr_inc
+            shifts = np.maximum(starts + nr_win - ph_len, 0)
+
+            return starts - shifts, shifts
+
+        key = (ph_i_len, ph_j_len)
+        if key not in self.__grid_windows:
+            nr_win = int(self.__clap_win * 0.75)
+            nr_inc = int(np.floor(nr_win / 4))
+            # Indices begin from zero on Python. That's why those values are greater than StaMPS
+            nr_win_i = int(np.ceil((ph_i_len - 1) / nr_inc) - 3)
+            nr_win_j = int(np.ceil((ph_j_len - 1) / nr_inc) - 3) + 1
+
+            i_starts, i_shifts = get_window_starts(ph_i_len, nr_win_i)
+            j_starts, j_shifts = get_window_starts(ph_j_len, nr_win_j)
+
+            # Last row and column are zeros. Shifted indexes point there
+            wind_func = np.pad(make_wind_func(create_grid(nr_win)), ((0, 1), (0, 1)), 'constant')
+            win_ind = np.arange(nr_win)
+            row_ind = win_ind - i_shifts[:, np.newaxis]
+            row_ind[row_ind < 0] = nr_win
+            col_ind = win_ind - j_shifts[:, np.newaxis]
+            col_ind[col_ind < 0] = nr_win
+            wind_func = wind_func[row_ind[:, np.newaxis, :, np.newaxis],
+                                  col_ind[np.newaxis, :, np.newaxis, :]]
+
+            grid_ind = ((i_starts[:, np.newaxis, np.newaxis, np.newaxis] + win_ind[:, np.newaxis])
+                        * ph_j_len + j_starts[np.newaxis, :, np.newaxis, np.newaxis]
+                        + win_ind).ravel()
+
+            self.__grid_windows[key] = (i_starts, j_starts, wind_func, grid_ind)
+
+        return self.__grid_windows[key]
+
+    def __smooth(self, resp: np.ndarray) -> np.ndarray:
+        """MatlabUtils.filter2 with 2D smoothing kernel on last two axes, made as 1D passes over
+        both axes. Outside of window are zeros"""
+        half_len = len(self.__smooth_kernel) // 2
+        for axis in (-2, -1):
+            resp = np.moveaxis(resp, axis, -1)
+            resp_len = resp.shape[-1]
+            padded = np.pad(resp, [(0, 0)] * (resp.ndim - 1) + [(half_len, half_len)], 'constant')
+
+            smoothed = np.zeros_like(resp)
+            for i, kernel_value in enumerate(self.__smooth_kernel):
+                smoothed += kernel_value * padded[..., i:i + resp_len]
+
+            resp = np.moveaxis(smoothed, -1, axis)
+
+        return resp
@@ -0,0 +1,157 @@
+import threading
+import timeit
+
+import numpy as np
+
+from scripts.utils.internal.LoggerFactory import LoggerFactory
+
+try:
+    import scipy.fft as scipy_fft
+    IS_SCIPY_WORKERS = True
+except ImportError:
+    # scipy.fft is in SciPy 1.4 and newer. Older SciPy has fftpack without workers
+    import scipy.fftpack as scipy_fft
+    IS_SCIPY_WORKERS = False
+
+try:
+    import pyfftw
+except ImportError:
+    # Without pyFFTW only numpy and scipy backends are used
+    pyfftw = None
+
+
+class FftBackend:
+    """2D FFT's for CLAP filtering (PsEstGamma and PsSelect). Transforms are made over given axes,
+    so many windows can be transformed at once.
+
+    BACKEND_NUMPY is numpy.fft. BACKEND_SCIPY is scipy.fft with 'workers' threads.
+    BACKEND_PYFFTW uses pyFFTW plans with 'workers' threads. Plans are made once for every
+    array shape and reused, because CLAP windows are always same size.
+    BACKEND_FASTEST chooses fastest backend with microbenchmark (see get_fastest_backend).
+    Benchmark is made once for every number of workers in process"""
+
+    BACKEND_NUMPY = "numpy"
+    BACKEND_SCIPY = "scipy"
+    BACKEND_PYFFTW = "pyfftw"
+    BACKEND_FASTEST = "fastest"
+
+    # CLAP window with padding (clap_win is 32 in PsEstGamma and PsSelect)
+    BENCHMARK_SHAPE = (64, 32, 32)
+
+    # Fastest backends by number of workers (see get_fastest_backend)
+    __fastest_backends = {}
+
+    def __init__(self, backend: str = BACKEND_NUMPY, workers: int = 1):
+        self.__logger = LoggerFactory.create("FftBackend")
+
+        self.workers = workers
+        if backend == self.BACKEND_FASTEST:
+            self.backend = self.get_fastest_backend(workers)
+            self.__logger.info("Fastest FFT backend '{0}'".format(self.backend))
+        else:
+            self.backend = self.get_backend(backend)
+
+        # pyFFTW plans by shape, type, axes and direction. Every thread has its own plans,
+        # because plan input and output arrays are reused
+        self.__thread_plans = threading.local()
+
+    @staticmethod
+    def get_backend(backend: str) -> str:
+        """Backend that is really used. When pyFFTW is not installed then numpy backend is used
+        instead of pyFFTW backend"""
+        backends = FftBackend.get_backends()
+        if backend not in backends + [FftBackend.BACKEND_PYFFTW]:
+            raise AttributeError("Unknown FFT backend '{0}'. Use '{1}', '{2}', '{3}' or '{4}'"
+                                 .format(backend, FftBackend.BACKEND_NUMPY,
+                                         FftBackend.BACKEND_SCIPY, FftBackend.BACKEND_PYFFTW,
+                                         FftBackend.BACKEND_FASTEST))
+
+        if backend not in backends:
+            LoggerFactory.create("FftBackend").warning(
+                "pyFFTW is not installed, using '{0}' FFT backend".format(
+                    FftBackend.BACKEND_NUMPY))
+            return FftBackend.BACKEND_NUMPY
+
+        return backend
+
+    @staticmethod
+    def get_backends() -> list:
+        """Backends that are installed"""
+        backends = [FftBackend.BACKEND_NUMPY, FftBackend.BACKEND_SCIPY]
+        if pyfftw is not None:
+            backends.append(FftBackend.BACKEND_PYFFTW)
+
+        return backends
+
+    @staticmethod
+    def benchmark(workers: int = 1, shape: tuple = BENCHMARK_SHAPE, repeat: int = 5) -> dict:
+        """Microbenchmark of installed backends. Time of best fft2 and ifft2 round trip in seconds
+        by backend. Random complex windows are transformed over last two axes"""
+        random = np.random.RandomState(0)
+        windows = random.randn(*shape) + 1j * random.randn(*shape)
+
+        times = {}
+        for backend in FftBackend.get_backends():
+            fft_backend = FftBackend(backend, workers)
+
+            def round_trip():
+                fft_backend.ifft2(fft_backend.fft2(windows))
+
+            # First call makes pyFFTW plans
+            round_trip()
+            times[backend] = min(timeit.repeat(round_trip, number=10, repeat=repeat)) / 10
+
+        return times
+
+    @staticmethod
+    def get_fastest_backend(workers: int = 1) -> str:
+        """Fastest installed backend. Benchmark is made only in first call with these workers,
+        so every PsEstGamma and PsSelect doesn't make it again"""
+        if workers not in FftBackend.__fastest_backends:
+            times = FftBackend.benchmark(workers)
+            FftBackend.__fastest_backends[workers] = min(times, key=times.get)
+
+        return FftBackend.__fastest_backends[workers]
+
+    def fft2(self, a: np.ndarray, axes=(-2, -1)) -> np.ndarray:
+        return self.__transform(a, axes, False)
+
+    def ifft2(self, a: np.ndarray, axes=(-2, -1)) -> np.ndarray:
+        return self.__transform(a, axes, True)
+
+    def __transform(self, a: np.ndarray, axes: tuple, is_inverse: bool) -> np.ndarray:
+        if self.backend == self.BACKEND_PYFFTW:
+            # Plan output array is reused in next transform
+            return self.__get_plan(a, axes, is_inverse)(a).copy()
+        elif self.backend == self.BACKEND_SCIPY:
+            transform = scipy_fft.ifft2 if is_inverse else scipy_fft.fft2
+            if IS_SCIPY_WORKERS:
+                return transform(a, axes=axes, workers=self.workers)
+            return transform(a, axes=axes)
+        else:
+            transform = np.fft.ifft2 if is_inverse else np.fft.fft2
+            return transform(a, axes=axes)
+
+    def __get_plan(self, a: np.ndarray, axes: tuple, is_inverse: bool):
+        plans = getattr(self.__thread_plans, 'plans', None)
+        if plans is None:
+            plans = self.__thread_plans.plans = {}
+
+        key = (a.shape, a.dtype, tuple(axes), is_inverse)
+        if key not in plans:
+            builder = pyfftw.builders.ifft2 if is_inverse else pyfftw.builders.fft2
+            # Plan is made with copy, because FFTW overwrites input when planning
+            plans[key] = builder(a.copy(), axes=axes, threads=self.workers,
+                                 planner_effort='FFTW_MEASURE')
+
+        return plans[key]
+
+
+if __name__ == '__main__':
+    # python -m scripts.funs.FftBackend [workers]
+    import sys
+
+    bench_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    bench_times = FftBackend.benchmark(bench_workers)
+    for bench_backend in sorted(bench_times, key=bench_times.get):
+        print("{0}: {1:.3f} ms".format(bench_backend, bench_times[bench_backend] * 1000))
@@ -1,9 +1,13 @@
 import numpy as np
 
 import math
+import timeit
+from typing import Callable
 
+from scripts.funs import PsTopofitKernel
 from scripts.utils.ArrayUtils import ArrayUtils
-from scripts.utils.MatlabUtils import MatlabUtils
+from scripts.utils.internal.DataTypes import DataTypes
+from scripts.utils.internal.LoggerFactory import LoggerFactory
 
 
 # Todo tests for class
@@ -16,14 +20,56 @@ class PsTopofit:
     n_opt = np.ndarray
     ph_res = np.ndarray
 
-    def __init__(self, sw_array_shape: tuple, nr_ps: int, nr_ifg: int):
+    # Possible values for engine. Numba engine is used only when numba is installed
+    ENGINE_NUMPY = "numpy"
+    ENGINE_NUMBA = "numba"
+
+    # Possible values for search. With coarse to fine search only some of the trials are found
+    # (see __get_trial_coherence_coarse_to_fine). Chosen trial is same as with exhaustive search
+    SEARCH_EXHAUSTIVE = "exhaustive"
+    SEARCH_COARSE_TO_FINE = "coarse_to_fine"
+
+    # Step between coarse trials in coarse to fine search
+    __COARSE_STEP = 4
+
+    # When there are at least that many trials then exhaustive search finds trial coherences with
+    # non-uniform FFT (see __get_trial_coherence_nufft)
+    __NUFFT_MIN_TRIALS = 32
+    # Gaussian kernel width in grid points and approximation error of non-uniform FFT coherence
+    __NUFFT_SPREAD = 12
+    __NUFFT_TOLERANCE = 1e-9
+
+    # How many trial phase elements (pixels * interferograms * trials) are in memory at once
+    __BLOCK_ELEMENTS = 1 << 21
+
+    def __init__(self, sw_array_shape: tuple, nr_ps: int, nr_ifg: int,
+                 precision: str = DataTypes.PRECISION_DOUBLE, engine: str = ENGINE_NUMPY,
+                 search: str = SEARCH_EXHAUSTIVE):
+        """precision = DataTypes.PRECISION_SINGLE or DataTypes.PRECISION_DOUBLE. With single
+        precision trial phases and ph_res are float32/ complex64
+        engine = ENGINE_NUMPY or ENGINE_NUMBA. Numba engine finds pixels in parallel (see
+        PsTopofitKernel) and always calculates in double precision, only ph_res is saved with
+        given precision
+        search = SEARCH_EXHAUSTIVE or SEARCH_COARSE_TO_FINE. Coarse to fine search is used only
+        with numpy engine and when every pixel has its own bperp"""
+        if search not in (self.SEARCH_EXHAUSTIVE, self.SEARCH_COARSE_TO_FINE):
+            raise AttributeError("Unknown topofit search '{0}'. Use '{1}' or '{2}'".format(
+                search, self.SEARCH_EXHAUSTIVE, self.SEARCH_COARSE_TO_FINE))
+
         self.__nr_ps = nr_ps
+        self.__precision = precision
+        self.__engine = self.get_engine(engine)
+        self.__coarse_step = self.__COARSE_STEP if search == self.SEARCH_COARSE_TO_FINE else 1
+
+        # How many trial coherences ps_topofit_loop found exactly. With exhaustive search and
+        # less than __NUFFT_MIN_TRIALS trials it is number of pixels * number of trials
+        self.nr_evaluated_trials = 0
 
         self.k_ps = np.zeros(sw_array_shape)
         self.c_ps = np.zeros(sw_array_shape)
         self.coh_ps = np.zeros(sw_array_shape)
         self.n_opt = np.zeros(sw_array_shape)
-        self.ph_res = np.zeros((nr_ps, nr_ifg))
+        self.ph_res = np.zeros((nr_ps, nr_ifg), DataTypes.get_float_type(precision))
 
     def ps_topofit_loop(self, ph: np.ndarray, ph_patch: np.ndarray, bprep: np.ndarray,
                         nr_trial_wraps: float, ifg_ind=None):
@@ -31,89 +77,447 @@ class PsTopofit:
         The Function for calculating topofit. The arrays that are initialized in constructor are filled with
         values in this function.
 
+        Pixels are processed in blocks (see __get_block_size). All pixels in block are found at
+        once, results are same as finding them pixel by pixel with ps_topofit_fun.
+
         :param ph:
         :param ph_patch:
-        :param bprep:
+        :param bprep: (nr_ps, nr_ifgs) array when every pixel has its own bperp or (nr_ifgs,)
+            array when bperp is same for all pixels. Then trial phases are found only once and
+            trial coherence is found with matrix product
         :param nr_trial_wraps:
-        :param ifg_ind:
+        :param ifg_ind: When set then phase differences are normalized and only those
+            interferograms are used
         :return: None. The calculated values are written in the class parameters (k_ps, c_ps, coh_ps,
         n_opt, ph_res).
         """
 
-        for i in range(self.__nr_ps):
-            psdph = np.multiply(ph[i, :], ph_patch[i, :].conj())
-
-            if np.count_nonzero(np.isnan(psdph)) == 0 and np.count_nonzero(psdph == 0) == 0:
-                if ifg_ind is not None:
-                    psdph = psdph / np.abs(psdph)
-                    psdph = psdph[ifg_ind]
-
-                phase_residual, coh_0, static_offset, k_0 = self.ps_topofit_fun(psdph,
-                                                                       bprep[i, ifg_ind].conj().transpose(),
-                                                                       nr_trial_wraps)
-                self.k_ps[i] = k_0[0]
-                self.c_ps[i] = static_offset
-                self.coh_ps[i] = coh_0
-                self.n_opt[i] = len(k_0)
-                if psdph is None:
-                    self.ph_res[i, :] = np.angle(phase_residual).transpose()
-                else:
-                    self.ph_res[i, ifg_ind] = np.angle(phase_residual).transpose()[0]
+        is_bperp_shared = len(bprep.shape) == 1
+        is_normalized = ifg_ind is not None
+        if ifg_ind is None:
+            ifg_ind = np.arange(ph.shape[1])
+
+        trial_multi = self.__get_trial_multi(nr_trial_wraps)
+
+        if self.__engine == self.ENGINE_NUMBA:
+            if is_bperp_shared:
+                bprep = np.broadcast_to(bprep, ph.shape)
+            PsTopofitKernel.topofit_kernel(ph, ph_patch, bprep, ifg_ind, is_normalized,
+                                           trial_multi, self.k_ps, self.c_ps, self.coh_ps,
+                                           self.n_opt, self.ph_res)
+            self.nr_evaluated_trials += self.__nr_ps * len(trial_multi)
+            return
+
+        block_size = self.__get_block_size(len(ifg_ind), len(trial_multi))
+
+        shared_bperp = None
+        shared_trial_phase = None
+        if is_bperp_shared:
+            shared_bperp = bprep[ifg_ind][np.newaxis]
+            shared_trial_phase = self.__get_shared_trial_phase(shared_bperp, trial_multi,
+                                                               self.__precision)
+
+        for start in range(0, self.__nr_ps, block_size):
+            end = min(start + block_size, self.__nr_ps)
+
+            psdph = np.multiply(ph[start:end], ph_patch[start:end].conj())
+
+            is_valid = ~np.any(np.isnan(psdph) | (psdph == 0), axis=1)
+            invalid_ind = start + np.flatnonzero(~is_valid)
+            self.k_ps[invalid_ind] = np.nan
+            self.coh_ps[invalid_ind] = 0
+
+            valid_ind = np.flatnonzero(is_valid)
+            if len(valid_ind) == 0:
+                continue
+
+            psdph = psdph[valid_ind]
+            if is_normalized:
+                psdph = psdph / np.abs(psdph)
+            # Column indexing may give Fortran ordered array. Sums over rows must be made over
+            # contiguous memory or they are not summed in same order as for one pixel
+            psdph = np.ascontiguousarray(psdph[:, ifg_ind])
+
+            if is_bperp_shared:
+                bperp = shared_bperp
             else:
-                self.k_ps[i] = np.nan
-                self.coh_ps[i] = 0
+                bperp = np.ascontiguousarray(bprep[start + valid_ind][:, ifg_ind])
+
+            phase_residual, coh_0, static_offset, k_0, nr_evaluated_trials = \
+                self.__topofit_block(psdph, bperp, trial_multi, self.__precision,
+                                     shared_trial_phase, self.__coarse_step)
+            self.nr_evaluated_trials += nr_evaluated_trials
+
+            ps_ind = start + valid_ind
+            self.k_ps[ps_ind, 0] = k_0
+            self.c_ps[ps_ind, 0] = static_offset
+            self.coh_ps[ps_ind, 0] = coh_0
+            self.n_opt[ps_ind, 0] = 1
+            self.ph_res[ps_ind[:, np.newaxis], ifg_ind] = np.angle(phase_residual)
 
     @staticmethod
-    def ps_topofit_fun(phase: np.ndarray, bperp_meaned: np.ndarray, nr_trial_wraps: float):
-        # To make sure that the results are correct we transform bperp_meaned into column matrix
-        if (len(bperp_meaned.shape) == 1):
-            bperp_meaned = ArrayUtils.to_col_matrix(bperp_meaned)
+    def benchmark(nr_trial_wraps: float, nr_ps: int = 20000, nr_ifgs: int = 40,
+                  repeat: int = 3) -> dict:
+        """Microbenchmark of trial searches (numpy engine, every pixel has its own bperp). Half
+        of the synthetic pixels are noisy. Returns best time in seconds and exactly found trials
+        per pixel by search. 'dense' is exhaustive search without non-uniform FFT"""
+        SEARCH_DENSE = "dense"
 
-        # The result of get_nr_trial_wraps is not correct in this case, so we need to find it again
-        bperp_range = np.amax(bperp_meaned) - np.amin(bperp_meaned)
+        random = np.random.RandomState(0)
+        bperp = random.uniform(-300, 300, (nr_ps, nr_ifgs))
+        k_ps = random.uniform(-1, 1, (nr_ps, 1)) * nr_trial_wraps * 2 * math.pi / np.ptp(
+            bperp, axis=1, keepdims=True)
+        noise = np.where(random.rand(nr_ps, 1) < 0.5, 0.4, 3.0)
+        ph = np.exp(1j * (k_ps * bperp + random.normal(0, 1, (nr_ps, nr_ifgs)) * noise))
+        ph_patch = np.ones((nr_ps, nr_ifgs))
+
+        results = {}
+        for search in (SEARCH_DENSE, PsTopofit.SEARCH_EXHAUSTIVE, PsTopofit.SEARCH_COARSE_TO_FINE):
+            topofits = []
+
+            def topofit_loop():
+                topofit = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs,
+                                    search=PsTopofit.SEARCH_EXHAUSTIVE if search == SEARCH_DENSE
+                                    else search)
+                topofit.ps_topofit_loop(ph, ph_patch, bperp, nr_trial_wraps)
+                topofits.append(topofit)
+
+            nufft_min_trials = PsTopofit.__NUFFT_MIN_TRIALS
+            if search == SEARCH_DENSE:
+                PsTopofit.__NUFFT_MIN_TRIALS = np.inf
+            try:
+                seconds = min(timeit.repeat(topofit_loop, number=1, repeat=repeat))
+            finally:
+                PsTopofit.__NUFFT_MIN_TRIALS = nufft_min_trials
+
+            results[search] = (seconds, topofits[-1].nr_evaluated_trials / nr_ps)
+
+        return results
 
+    @staticmethod
+    def get_engine(engine: str) -> str:
+        """Engine that is really used. When numba is not installed then numpy engine is used
+        instead of numba engine"""
+        if engine not in (PsTopofit.ENGINE_NUMPY, PsTopofit.ENGINE_NUMBA):
+            raise AttributeError("Unknown topofit engine '{0}'. Use '{1}' or '{2}'".format(
+                engine, PsTopofit.ENGINE_NUMPY, PsTopofit.ENGINE_NUMBA))
+
+        if engine == PsTopofit.ENGINE_NUMBA and not PsTopofitKernel.IS_AVAILABLE:
+            LoggerFactory.create("PsTopofit").warning(
+                "numba is not installed, using '{0}' topofit engine".format(PsTopofit.ENGINE_NUMPY))
+            return PsTopofit.ENGINE_NUMPY
+
+        return engine
+
+    @staticmethod
+    def ps_topofit_fun(phase: np.ndarray, bperp_meaned: np.ndarray, nr_trial_wraps: float,
+                       precision: str = DataTypes.PRECISION_DOUBLE):
+        """Topofit for one pixel. Returns phase residual as column array and coherence, static
+        offset and k as arrays with one element"""
+
+        phase = np.reshape(phase, (1, -1))
+        bperp_meaned = np.reshape(bperp_meaned, (1, -1))
+
+        trial_multi = PsTopofit.__get_trial_multi(nr_trial_wraps)
+
+        phase_residual, coherence_0, static_offset, k_0, _ = PsTopofit.__topofit_block(
+            phase, bperp_meaned, trial_multi, precision)
+
+        return phase_residual.transpose(), coherence_0, static_offset, k_0
+
+    @staticmethod
+    def get_shared_bperp_coherence(bperp_meaned: np.ndarray, nr_trial_wraps: float,
+                                   precision: str = DataTypes.PRECISION_DOUBLE) \
+            -> Callable[[np.ndarray], np.ndarray]:
+        """Returns function that finds topofit coherence (coherence_0 in ps_topofit_fun) for
+        block of pixels that all have same bperp_meaned. Every row in function parameter is one
+        pixel phase.
+
+        Trial phase matrix is found only once here and for every block trial coherences are
+        found with one matrix product."""
+
+        bperp_meaned = np.reshape(bperp_meaned, (1, -1))
+        trial_multi = PsTopofit.__get_trial_multi(nr_trial_wraps)
+        trial_phase = PsTopofit.__get_shared_trial_phase(bperp_meaned, trial_multi, precision)
+
+        def get_coherence(phase: np.ndarray) -> np.ndarray:
+            _, coherence_0, _, _, _ = PsTopofit.__topofit_block(phase, bperp_meaned, trial_multi,
+                                                                precision, trial_phase)
+            return coherence_0
+
+        return get_coherence
+
+    @staticmethod
+    def __get_trial_multi(nr_trial_wraps: float) -> np.ndarray:
         CONST = 8 * nr_trial_wraps  # todo what const? Why 8
         trial_multi_start = -np.ceil(CONST)
         trial_multi_end = np.ceil(CONST)
-        trial_multi = ArrayUtils.arange_include_last(trial_multi_start, trial_multi_end, 1)
+        return ArrayUtils.arange_include_last(trial_multi_start, trial_multi_end, 1)
+
+    @staticmethod
+    def __get_block_size(nr_ifgs: int, nr_trials: int) -> int:
+        """How many pixels are in block so that trial phase array (pixels * interferograms *
+        trials) has about __BLOCK_ELEMENTS elements"""
+        return max(1, PsTopofit.__BLOCK_ELEMENTS // max(1, nr_ifgs * nr_trials))
 
-        trial_phase = bperp_meaned / bperp_range * math.pi / 4
-        trial_phase = np.exp(np.outer(-1j * trial_phase, trial_multi))
+    @staticmethod
+    def __get_slope(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Least squares slope of line through origin (y = mopt * x) for every row.
+
+        Same as np.linalg.lstsq with one column. When all x values in row are zeros then lstsq
+        gives minimum norm solution, that is zero, so here is also zero"""
+
+        x_sq_sum = np.sum(x * x, axis=1)
+        xy_sum = np.sum(x * y, axis=1)
 
-        # In order to successfully multiply, we need to transform 'phase' array to column matrix
-        phase = ArrayUtils.to_col_matrix(phase)
-        phase_tile = np.tile(phase, (1, len(trial_multi)))
-        phaser = np.multiply(trial_phase, phase_tile)
+        is_degenerate = x_sq_sum == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mopt = xy_sum / np.where(is_degenerate, 1, x_sq_sum)
+        mopt[is_degenerate] = 0
 
-        phaser_sum = MatlabUtils.sum(phaser)
+        return mopt
 
-        phase_abs_sum = MatlabUtils.sum(np.abs(phase))
-        trial_coherence = np.abs(phaser_sum) / phase_abs_sum
-        trial_coherence_max_ind = np.where(trial_coherence == MatlabUtils.max(trial_coherence))
+    @staticmethod
+    def __get_shared_trial_phase(bperp: np.ndarray, trial_multi: np.ndarray, precision: str):
+        """Trial phase matrix (nr_ifgs x nr_trials) for pixels that have same bperp (one row
+        array)"""
+        bperp = bperp.astype(DataTypes.get_float_type(precision), copy=False)
+        bperp_range = np.amax(bperp) - np.amin(bperp)
+        trial_phase = bperp[0] / bperp_range * math.pi / 4
+
+        return np.exp(np.outer(-1j * trial_phase, trial_multi)).astype(np.complex128, copy=False)
 
-        k_0 = (math.pi / 4 / bperp_range) * trial_multi[trial_coherence_max_ind][0]
+    @staticmethod
+    def __get_trial_coherence_coarse_to_fine(phase: np.ndarray, trial_phase: np.ndarray,
+                                             trial_multi: np.ndarray, phase_abs_sum: np.ndarray,
+                                             coarse_step: int) -> (np.ndarray, int):
+        """Trial coherences where only coarse trials (every coarse_step trial) and trials that can
+        be bigger than biggest coarse trial coherence are found. Others are -inf.
 
-        re_phase = np.multiply(phase, np.exp(-1j * (k_0 * bperp_meaned)))
-        phase_offset = MatlabUtils.sum(re_phase)
-        re_phase = np.angle(re_phase * phase_offset.conjugate())
+        Trial sum S(t) = sum(phase * exp(-1j * trial_phase * t)) is same in absolute value when
+        trial_phase is shifted by center c. With shifted phases Taylor series gives
+        |S(t0 + d)| <= |S(t0) + d * S'(t0)| + d^2 / 2 * sum(|phase| * (trial_phase - c)^2)
+        where t0 is coarse trial. Trials where this upper bound is smaller than biggest coarse
+        coherence can't be the biggest, so only other trials are found. Found coherences are
+        calculated with same formula as in exhaustive search, so chosen trial is same (unless
+        trial coherences differ only by rounding errors).
+
+        Returns trial coherences and how many trials were found"""
+
+        # Bounds are for exact values, but found coherences have rounding errors
+        BOUND_TOLERANCE = 1000 * np.finfo(phase.dtype).eps
+
+        SUM_TYPE = np.complex128
+        nr_trials = len(trial_multi)
+
+        coarse_ind = np.arange(0, nr_trials, coarse_step)
+        if coarse_ind[-1] != nr_trials - 1:
+            coarse_ind = np.append(coarse_ind, nr_trials - 1)
+
+        trial_coherence = np.full((len(phase), nr_trials), -np.inf)
+
+        coarse_trial_phase = np.exp(
+            (-1j * trial_phase)[:, :, np.newaxis] * trial_multi[coarse_ind]).astype(phase.dtype,
+                                                                                    copy=False)
+        phaser_sum = np.sum(coarse_trial_phase * phase[:, :, np.newaxis], axis=1, dtype=SUM_TYPE)
+        phaser_sum_deriv = np.sum(
+            coarse_trial_phase * (phase * (-1j * trial_phase))[:, :, np.newaxis], axis=1,
+            dtype=SUM_TYPE)
+        del coarse_trial_phase
+
+        coarse_coherence = np.abs(phaser_sum) / phase_abs_sum[:, np.newaxis]
+        trial_coherence[:, coarse_ind] = coarse_coherence
+        max_coarse_coherence = np.amax(coarse_coherence, axis=1)
+
+        weigth = np.abs(phase).astype(np.float64)
+        center = np.sum(weigth * trial_phase, axis=1) / phase_abs_sum
+        spread = np.sum(weigth * (trial_phase - center[:, np.newaxis]) ** 2, axis=1)
+        phaser_sum_deriv = phaser_sum_deriv + 1j * center[:, np.newaxis] * phaser_sum
+
+        # Coarse trials on the left and right side of every trial. Trial multipliers are
+        # integers one after another, so distance is difference between indexes
+        trial_ind = np.arange(nr_trials)
+        left_ind = np.searchsorted(coarse_ind, trial_ind, side='right') - 1
+        right_ind = np.minimum(left_ind + 1, len(coarse_ind) - 1)
+
+        def get_upper_bound(ind: np.ndarray) -> np.ndarray:
+            distance = trial_ind - coarse_ind[ind]
+            return (np.abs(phaser_sum[:, ind] + distance * phaser_sum_deriv[:, ind])
+                    + distance ** 2 / 2 * spread[:, np.newaxis]) / phase_abs_sum[:, np.newaxis]
+
+        upper_bound = np.minimum(get_upper_bound(left_ind), get_upper_bound(right_ind))
+        is_candidate = upper_bound >= max_coarse_coherence[:, np.newaxis] - BOUND_TOLERANCE
+        is_candidate[:, coarse_ind] = False
+
+        rows, cols = np.nonzero(is_candidate)
+        trial_coherence[rows, cols] = PsTopofit.__get_exact_trial_coherence(
+            phase, trial_phase, trial_multi, phase_abs_sum, rows, cols)
+
+        return trial_coherence, len(phase) * len(coarse_ind) + len(rows)
+
+    @staticmethod
+    def __get_trial_coherence_nufft(phase: np.ndarray, trial_phase: np.ndarray,
+                                    trial_multi: np.ndarray, phase_abs_sum: np.ndarray):
+        """Trial coherences where all trial sums S(t) = sum(phase * exp(-1j * trial_phase * t))
+        are found at once with non-uniform FFT (Gaussian gridding, Greengard and Lee 2004).
+
+        Phases are spread to oversampled regular grid with Gaussian kernel, grid is transformed
+        with FFT and the result is divided by Gaussian Fourier transform. Cost for one pixel is
+        O(nr_ifgs * __NUFFT_SPREAD + nr_trials * log(nr_trials)). Trial multipliers must be integers
+        one after another. Coherence error is less than 1e-10.
+
+        Only trials near the biggest approximated coherence are found exactly, others are -inf.
+        Found coherences are calculated with same formula as in exhaustive search, so chosen
+        trial is same (unless trial coherences differ only by rounding errors).
+
+        Returns trial coherences and how many trials were found exactly"""
+
+        SPREAD = PsTopofit.__NUFFT_SPREAD
+        OVERSAMPLING = 2
+
+        nr_block_ps = len(phase)
+        nr_trials = len(trial_multi)
+        grid_size = max(OVERSAMPLING * nr_trials, 2 * SPREAD)
+        grid_step = 2 * math.pi / grid_size
+        tau = math.pi * SPREAD / (nr_trials ** 2 * OVERSAMPLING * (OVERSAMPLING - 0.5))
+
+        # |S(t)| doesn't change when trial phases are shifted, so they are moved to [0, 2 * pi)
+        x = trial_phase.astype(np.float64)
+        x = np.mod(x - (np.amax(x, axis=1) + np.amin(x, axis=1))[:, np.newaxis] / 2, 2 * math.pi)
+
+        grid_ind = np.floor(x / grid_step).astype(np.int64)[:, :, np.newaxis] + np.arange(
+            -SPREAD + 1, SPREAD + 1)
+        spread_values = phase.astype(np.complex128)[:, :, np.newaxis] * np.exp(
+            -(x[:, :, np.newaxis] - grid_ind * grid_step) ** 2 / (4 * tau))
+
+        flat_grid_ind = (np.arange(nr_block_ps)[:, np.newaxis, np.newaxis] * grid_size
+                         + np.mod(grid_ind, grid_size)).ravel()
+        grid = np.bincount(flat_grid_ind, spread_values.real.ravel(), nr_block_ps * grid_size) \
+            + 1j * np.bincount(flat_grid_ind, spread_values.imag.ravel(), nr_block_ps * grid_size)
+        del grid_ind, spread_values, flat_grid_ind
+
+        spectrum = np.fft.fft(grid.reshape(nr_block_ps, grid_size), axis=1)
+
+        trial_multi_int = trial_multi.astype(np.int64)
+        deconvolution = math.sqrt(math.pi / tau) / grid_size * np.exp(trial_multi_int ** 2 * tau)
+        approx_coherence = np.abs(spectrum[:, np.mod(trial_multi_int, grid_size)]) * deconvolution \
+            / phase_abs_sum[:, np.newaxis]
+
+        # Approximation error and rounding errors in exactly found coherences
+        tolerance = PsTopofit.__NUFFT_TOLERANCE + 1000 * np.finfo(phase.dtype).eps
+        is_candidate = approx_coherence >= np.amax(approx_coherence, axis=1)[:, np.newaxis] \
+            - 2 * tolerance
+
+        trial_coherence = np.full((nr_block_ps, nr_trials), -np.inf)
+        rows, cols = np.nonzero(is_candidate)
+        trial_coherence[rows, cols] = PsTopofit.__get_exact_trial_coherence(
+            phase, trial_phase, trial_multi, phase_abs_sum, rows, cols)
+
+        return trial_coherence, len(rows)
+
+    @staticmethod
+    def __get_exact_trial_coherence(phase: np.ndarray, trial_phase: np.ndarray,
+                                    trial_multi: np.ndarray, phase_abs_sum: np.ndarray,
+                                    rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Trial coherences for pixels (rows) and trials (cols) that are calculated with same
+        formula and summing order as in exhaustive search"""
+
+        if len(rows) == 0:
+            return np.array([])
+
+        # Interferograms are first axis so that sums are made in same order as in exhaustive
+        # search
+        candidate_trial_phase = np.exp(
+            (-1j * np.ascontiguousarray(trial_phase[rows].T)) * trial_multi[cols]).astype(
+            phase.dtype, copy=False)
+        candidate_phaser_sum = np.sum(
+            candidate_trial_phase * np.ascontiguousarray(phase[rows].T), axis=0,
+            dtype=np.complex128)
+
+        return np.abs(candidate_phaser_sum) / phase_abs_sum[rows]
+
+    @staticmethod
+    def __topofit_block(phase: np.ndarray, bperp: np.ndarray, trial_multi: np.ndarray,
+                        precision: str, shared_trial_phase: np.ndarray = None,
+                        coarse_step: int = 1):
+        """Topofit for block of pixels. Every row in phase is one pixel. bperp has same shape as
+        phase or when pixels have same bperp then it is one row and shared_trial_phase is trial
+        phase matrix for it (see __get_shared_trial_phase). When coarse_step is bigger than one
+        then trials are found with coarse to fine search (not with shared_trial_phase).
+
+        Calculations are made in the same order than they were made for one pixel, so results
+        don't depend on block size.
+
+        Returns phase residual, coherence, static offset, k and how many trial coherences were
+        found"""
+
+        # Sums and least squares are made in double precision whatever the precision is
+        SUM_TYPE = np.complex128
+
+        phase = phase.astype(DataTypes.get_complex_type(precision), copy=False)
+        bperp = bperp.astype(DataTypes.get_float_type(precision), copy=False)
+
+        # The result of get_nr_trial_wraps is not correct in this case, so we need to find it again
+        bperp_range = np.amax(bperp, axis=1) - np.amin(bperp, axis=1)
+
+        phase_abs_sum = np.sum(np.abs(phase), axis=1, dtype=np.float64)
+
+        if shared_trial_phase is not None:
+            phaser_sum = np.dot(phase.astype(SUM_TYPE), shared_trial_phase)
+            trial_coherence = np.abs(phaser_sum) / phase_abs_sum[:, np.newaxis]
+            nr_evaluated_trials = trial_coherence.size
+        elif coarse_step > 1:
+            trial_phase = bperp / bperp_range[:, np.newaxis] * math.pi / 4
+            trial_coherence, nr_evaluated_trials = PsTopofit.__get_trial_coherence_coarse_to_fine(
+                phase, trial_phase, trial_multi, phase_abs_sum, coarse_step)
+        elif len(trial_multi) >= PsTopofit.__NUFFT_MIN_TRIALS:
+            trial_phase = bperp / bperp_range[:, np.newaxis] * math.pi / 4
+            # Only trials near maximum are found exactly, others are only approximated
+            trial_coherence, nr_evaluated_trials = PsTopofit.__get_trial_coherence_nufft(
+                phase, trial_phase, trial_multi, phase_abs_sum)
+        else:
+            trial_phase = bperp / bperp_range[:, np.newaxis] * math.pi / 4
+            trial_phase = np.exp((-1j * trial_phase)[:, :, np.newaxis] * trial_multi).astype(
+                phase.dtype, copy=False)
+            phaser_sum = np.sum(trial_phase * phase[:, :, np.newaxis], axis=1, dtype=SUM_TYPE)
+            del trial_phase
+            trial_coherence = np.abs(phaser_sum) / phase_abs_sum[:, np.newaxis]
+            nr_evaluated_trials = trial_coherence.size
+
+        # argmax returns first index when there are many maximums
+        trial_coherence_max_ind = np.argmax(trial_coherence, axis=1)
+
+        k_0 = (math.pi / 4 / bperp_range) * trial_multi[trial_coherence_max_ind]
+
+        re_phase = np.multiply(phase, np.exp(-1j * (k_0[:, np.newaxis] * bperp)))
+        phase_offset = np.sum(re_phase, axis=1, dtype=SUM_TYPE)
+        re_phase = np.angle(re_phase * phase_offset.conjugate()[:, np.newaxis])
         weigth = np.abs(phase)
-        bperp_meaned_weighted = weigth * bperp_meaned
-        re_phase_weighted = weigth * re_phase
-        # Numpy linalg functions work only with 2d array
-        if len(bperp_meaned_weighted.shape) > 2:
-            bperp_meaned_weighted = bperp_meaned_weighted[0]
-        if len(re_phase_weighted.shape) > 2:
-            re_phase_weighted = re_phase_weighted[0]
-
-        mopt = np.linalg.lstsq(bperp_meaned_weighted, re_phase_weighted)[0][0]
+        bperp_meaned_weighted = (weigth * bperp).astype(np.float64, copy=False)
+        re_phase_weighted = (weigth * re_phase).astype(np.float64, copy=False)
+
+        mopt = PsTopofit.__get_slope(bperp_meaned_weighted, re_phase_weighted)
         # In StaMPS k0
         k_0 = k_0 + mopt
 
-        phase_residual = np.multiply(phase, np.exp(-1j * (k_0 * bperp_meaned)))
-        phase_residual_sum = MatlabUtils.sum(phase_residual)
+        phase_residual = np.multiply(phase, np.exp(-1j * (k_0[:, np.newaxis] * bperp)))
+        phase_residual_sum = np.sum(phase_residual, axis=1, dtype=SUM_TYPE)
         # In StaMPS c0
         static_offset = np.angle(phase_residual_sum)
         # In StaMPS coh0
-        coherence_0 = np.abs(phase_residual_sum) / MatlabUtils.sum(np.abs(phase_residual))
+        coherence_0 = np.abs(phase_residual_sum) / np.sum(np.abs(phase_residual), axis=1,
+                                                          dtype=np.float64)
+
+        return phase_residual, coherence_0, static_offset, k_0, nr_evaluated_trials
+
+
+if __name__ == '__main__':
+    # python -m scripts.funs.PsTopofit [nr_trial_wraps ...]
+    import sys
 
-        return phase_residual, coherence_0, static_offset, k_0
\ No newline at end of file
+    bench_trial_wraps = [float(arg) for arg in sys.argv[1:]] or [0.5, 3, 10]
+    for bench_nr_trial_wraps in bench_trial_wraps:
+        bench_results = PsTopofit.benchmark(bench_nr_trial_wraps)
+        for bench_search, (bench_seconds, bench_trials) in bench_results.items():
+            print("trial wraps {0}, {1}: {2:.3f} s, {3:.1f} trials per pixel".format(
+                bench_nr_trial_wraps, bench_search, bench_seconds, bench_trials))
@@ -0,0 +1,111 @@
+"""Topofit kernel that is compiled with numba. Pixels are found in parallel (prange) and results
+are written straight to PsTopofit arrays. Same calculations as in PsTopofit numpy engine, but
+pixel by pixel and always in double precision.
+
+When numba is not installed then IS_AVAILABLE is False and PsTopofit uses numpy engine."""
+
+import cmath
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    # Without numba topofit is made only with numpy (see PsTopofit)
+    numba = None
+
+IS_AVAILABLE = numba is not None
+
+prange = numba.prange if IS_AVAILABLE else range
+
+
+def _topofit_kernel(ph: np.ndarray, ph_patch: np.ndarray, bprep: np.ndarray, ifg_ind: np.ndarray,
+                    is_normalized: bool, trial_multi: np.ndarray,
+                    k_ps: np.ndarray, c_ps: np.ndarray, coh_ps: np.ndarray, n_opt: np.ndarray,
+                    ph_res: np.ndarray):
+    nr_ps = ph.shape[0]
+    nr_ifgs = ph.shape[1]
+    nr_used_ifgs = len(ifg_ind)
+    nr_trials = len(trial_multi)
+
+    for i in prange(nr_ps):
+        is_valid = True
+        for j in range(nr_ifgs):
+            psdph = ph[i, j] * ph_patch[i, j].conjugate()
+            if math.isnan(psdph.real) or math.isnan(psdph.imag) or psdph == 0:
+                is_valid = False
+                break
+
+        if not is_valid:
+            k_ps[i, 0] = np.nan
+            coh_ps[i, 0] = 0
+            continue
+
+        phase = np.empty(nr_used_ifgs, np.complex128)
+        bperp = np.empty(nr_used_ifgs, np.float64)
+        for j in range(nr_used_ifgs):
+            psdph = ph[i, ifg_ind[j]] * ph_patch[i, ifg_ind[j]].conjugate()
+            if is_normalized:
+                psdph = psdph / abs(psdph)
+            phase[j] = psdph
+            bperp[j] = bprep[i, ifg_ind[j]]
+
+        bperp_min = bperp[0]
+        bperp_max = bperp[0]
+        phase_abs_sum = 0.0
+        for j in range(nr_used_ifgs):
+            bperp_min = min(bperp_min, bperp[j])
+            bperp_max = max(bperp_max, bperp[j])
+            phase_abs_sum += abs(phase[j])
+        bperp_range = bperp_max - bperp_min
+
+        # Trial with biggest coherence. First of them when there are many
+        max_trial_ind = 0
+        max_trial_coherence = -1.0
+        for t in range(nr_trials):
+            phaser_sum = 0j
+            for j in range(nr_used_ifgs):
+                trial_phase = bperp[j] / bperp_range * math.pi / 4
+                phaser_sum += cmath.exp(-1j * trial_phase * trial_multi[t]) * phase[j]
+            trial_coherence = abs(phaser_sum) / phase_abs_sum
+            if trial_coherence > max_trial_coherence:
+                max_trial_coherence = trial_coherence
+                max_trial_ind = t
+
+        k_0 = (math.pi / 4 / bperp_range) * trial_multi[max_trial_ind]
+
+        re_phase = np.empty(nr_used_ifgs, np.complex128)
+        phase_offset = 0j
+        for j in range(nr_used_ifgs):
+            re_phase[j] = phase[j] * cmath.exp(-1j * (k_0 * bperp[j]))
+            phase_offset += re_phase[j]
+
+        # Closed form least squares slope (see PsTopofit.__get_slope)
+        x_sq_sum = 0.0
+        xy_sum = 0.0
+        for j in range(nr_used_ifgs):
+            re_phase_angle = cmath.phase(re_phase[j] * phase_offset.conjugate())
+            weigth = abs(phase[j])
+            x = weigth * bperp[j]
+            x_sq_sum += x * x
+            xy_sum += x * weigth * re_phase_angle
+        mopt = xy_sum / x_sq_sum if x_sq_sum != 0 else 0.0
+        k_0 = k_0 + mopt
+
+        phase_residual_sum = 0j
+        phase_residual_abs_sum = 0.0
+        for j in range(nr_used_ifgs):
+            phase_residual = phase[j] * cmath.exp(-1j * (k_0 * bperp[j]))
+            phase_residual_sum += phase_residual
+            phase_residual_abs_sum += abs(phase_residual)
+            ph_res[i, ifg_ind[j]] = cmath.phase(phase_residual)
+
+        k_ps[i, 0] = k_0
+        c_ps[i, 0] = cmath.phase(phase_residual_sum)
+        coh_ps[i, 0] = abs(phase_residual_sum) / phase_residual_abs_sum
+        n_opt[i, 0] = 1
+
+
+# Compiled when it is called first time. Compiled code is cached to __pycache__ for next runs
+topofit_kernel = numba.njit(parallel=True, cache=True)(_topofit_kernel) if IS_AVAILABLE else None
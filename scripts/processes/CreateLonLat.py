@@ -2,71 +2,72 @@ import os
 from pathlib import Path
 
 import numpy as np
-from snappy import ProductIO
 
 from scripts.MetaSubProcess import MetaSubProcess
+from scripts.utils.internal.DataTypes import DataTypes
+from scripts.utils.internal.DimapReader import DimapReader
 from scripts.utils.internal.FolderConstants import FolderConstants
 from scripts.utils.internal.LoggerFactory import LoggerFactory
+from scripts.utils.internal.PatchFileReader import PatchFileReader
 
 from scripts.utils.internal.ProcessDataSaver import ProcessDataSaver
 
+try:
+    from snappy import ProductIO
+except ImportError:
+    # Without SNAP we can read bands only with DimapReader
+    ProductIO = None
+
 
 class CreateLonLat(MetaSubProcess):
-    __ARRAY_TYPE = np.float32
+    # How many band rows are read with one readPixels call
+    __READ_BLOCK_LINES = 512
+
+    # Possible values for geo_reader
+    GEO_READER_SNAP = "snap"
+    GEO_READER_NATIVE = "native"
 
     # Needed in PsFiles process to load data
     pscands_ij = None
     lonlat = None
 
-    def __init__(self, path: str, geo_ref_product: str):
+    def __init__(self, path: str, geo_ref_product: str, geo_reader: str = None,
+                 patch_folder_name: str = FolderConstants.PATCH_FOLDER_NAME):
+        """geo_reader = how lon and lat bands are read from geo_ref_product. 'snap' uses snappy and
+        'native' reads ENVI files straight from .data folder (see DimapReader). When None then
+        'snap' is used if snappy is installed, otherwise 'native'.
+        patch_folder_name = PATCH folder in path that is processed"""
+
         self.__FILE_NAME = "lonlat_process"
         self.__geo_ref_product = geo_ref_product
 
-        self.__PATCH_FOLDER = Path(path, FolderConstants.PATCH_FOLDER_NAME)
+        self.__PATCH_FOLDER = Path(path, patch_folder_name)
 
         self.__logger = LoggerFactory.create('CreateLonLat')
 
-        self.__logger.debug("PATCH_FOLDER {0}".format(self.__PATCH_FOLDER))
+        self.__geo_reader = self.__select_geo_reader(geo_reader)
+
+        self.__logger.debug("PATCH_FOLDER {0}, geo_reader {1}".format(self.__PATCH_FOLDER,
+                                                                      self.__geo_reader))
 
     def start_process(self):
         self.__logger.debug("Start")
 
-        product_with_geo_ref = ProductIO.readProduct(self.__geo_ref_product)
-        lon_band, lat_band = self.__get_lon_bands(product_with_geo_ref)
+        lon_band, lat_band = self.__get_lon_bands()
 
         if lon_band is None or lat_band is None:
             raise FileNotFoundError("lon_band, lat_band missing")
 
-        lonlat = []
-        with self.__load_pscands() as pscands:
-            for row in pscands:
-                if row == '':
-                    break
-
-                line = row.split(' ')
-                y = int(line[1])
-                x = int(line[2])
-
-                # tmp__pixel_array is needed because readPixels returns x-size that much what is set
-                # in third parameter. But there isn't any limiter for y-size and this means it takes
-                # how much it can.
-                # This needs optimization. That you load all rows in one take and set them to lonlat
-                tmp__pixel_array = np.zeros((1, 1), dtype=self.__ARRAY_TYPE)
-                tmp_lonlat = np.zeros((1, 2), dtype=self.__ARRAY_TYPE)
-                self.__read_pixel(x, y, lon_band, tmp__pixel_array)
-                tmp_lonlat[0, 0] = tmp__pixel_array[0]
-                self.__read_pixel(x, y, lat_band, tmp__pixel_array)
-                tmp_lonlat[0, 1] = tmp__pixel_array[0]
+        self.pscands_ij = self.__load_pscands()
 
-                lonlat.append(tmp_lonlat)
-
-                self.__add_to_pscands_array(int(line[0]), int(line[1]), int(line[2]))
-
-        self.pscands_ij = np.reshape(self.pscands_ij, (len(self.pscands_ij), 3))
+        # In pscands.1.ij second column is y (azimuth line) and third is x (range sample)
+        lonlat = np.zeros((len(self.pscands_ij), 2), dtype=DataTypes.LONLAT)
+        lonlat[:, 0] = self.__read_band_values(lon_band, self.pscands_ij)
+        lonlat[:, 1] = self.__read_band_values(lat_band, self.pscands_ij)
 
         self.__logger.debug("Done")
 
-        self.lonlat = np.reshape(lonlat, (len(lonlat), 2))
+        self.lonlat = lonlat
 
     def save_results(self, save_path: str):
         if self.pscands_ij is None:
@@ -85,30 +86,65 @@ class CreateLonLat(MetaSubProcess):
         self.pscands_ij = data["pscands_ij_array"]
         self.lonlat = data["lonlat"]
 
-    # TODO slowest part
-    # noinspection PyMethodMayBeStatic
-    def __read_pixel(self, x, y, band, tmp_array):
-        band.readPixels(x, y, 1, 1, tmp_array)
-
-    def __add_to_pscands_array(self, arr1: int, arr2: int, arr3: int):
-        """When we process the list, we append initial values to pscands"""
-        if (self.pscands_ij is None):
-            self.pscands_ij = []
-
-        self.pscands_ij.append(np.array([arr1, arr2, arr3]))
-
-    # noinspection PyMethodMayBeStatic
-    def __get_lon_bands(self, product_with_geo_ref):
-        lon_band = product_with_geo_ref.getBand('lon_band')
-        lat_band = product_with_geo_ref.getBand('lat_band')
+    def __read_band_values(self, band, pscands_ij: np.ndarray) -> np.ndarray:
+        """Reads band values for all pixels in pscands_ij. Instead of reading every pixel
+        separately we read candidates bounding box from band in large row blocks and then take
+        values with one fancy-index."""
+
+        y = pscands_ij[:, 1]
+        x = pscands_ij[:, 2]
+
+        if len(x) == 0:
+            # PATCH without candidates. There is no bounding box to read
+            return np.array([], dtype=DataTypes.LONLAT)
+
+        x_min, x_max = int(np.amin(x)), int(np.amax(x))
+        y_min, y_max = int(np.amin(y)), int(np.amax(y))
+        width = x_max - x_min + 1
+        height = y_max - y_min + 1
+
+        if isinstance(band, np.ndarray):
+            # Band from DimapReader. Only bounding box is read from disk
+            bounding_box = band[y_min:y_max + 1, x_min:x_max + 1].astype(DataTypes.LONLAT)
+        else:
+            bounding_box = np.zeros((height, width), dtype=DataTypes.LONLAT)
+            for start in range(0, height, self.__READ_BLOCK_LINES):
+                end = min(start + self.__READ_BLOCK_LINES, height)
+                # readPixels fills array in place. Slice of rows is contiguous so this is a view
+                band.readPixels(x_min, y_min + start, width, end - start, bounding_box[start:end])
+
+        return bounding_box[y - y_min, x - x_min]
+
+    def __get_lon_bands(self):
+        if self.__geo_reader == self.GEO_READER_NATIVE:
+            dimap_reader = DimapReader(self.__geo_ref_product)
+            lon_band = dimap_reader.get_band('lon_band')
+            lat_band = dimap_reader.get_band('lat_band')
+        else:
+            product_with_geo_ref = ProductIO.readProduct(self.__geo_ref_product)
+            lon_band = product_with_geo_ref.getBand('lon_band')
+            lat_band = product_with_geo_ref.getBand('lat_band')
 
         return lon_band, lat_band
 
-    def __load_pscands(self):
-        if self.__PATCH_FOLDER.is_dir():
-            # TODO Check if it is in this folder
-            path_to_pscands = Path(self.__PATCH_FOLDER, "pscands.1.ij")
-            if path_to_pscands.exists():
-                return path_to_pscands.open()
+    def __select_geo_reader(self, geo_reader: str) -> str:
+        if geo_reader is None or geo_reader == '':
+            if ProductIO is None:
+                return self.GEO_READER_NATIVE
             else:
-                raise FileNotFoundError("Path {0}".format(path_to_pscands))
+                return self.GEO_READER_SNAP
+        elif geo_reader == self.GEO_READER_SNAP:
+            if ProductIO is None:
+                raise ImportError("geo_reader is '{0}' but snappy is not installed".format(
+                    geo_reader))
+            return geo_reader
+        elif geo_reader == self.GEO_READER_NATIVE:
+            return geo_reader
+        else:
+            raise AttributeError("Unknown geo_reader '{0}'".format(geo_reader))
+
+    def __load_pscands(self) -> np.ndarray:
+        if not self.__PATCH_FOLDER.is_dir():
+            raise FileNotFoundError("No PATCH folder. Path {0}".format(self.__PATCH_FOLDER))
+
+        return PatchFileReader.load_pscands_ij(self.__PATCH_FOLDER)
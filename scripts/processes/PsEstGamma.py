@@ -1,12 +1,14 @@
+import hashlib
 import math
 import os
 
-import pydsm.relab
 import sys
 
 import scipy.signal
 
 from scripts.MetaSubProcess import MetaSubProcess
+from scripts.funs.ClapFilt import ClapFilt
+from scripts.funs.FftBackend import FftBackend
 from scripts.funs.PsTopofit import PsTopofit
 from scripts.processes.PsFiles import PsFiles
 
@@ -16,6 +18,7 @@ from scripts.utils.ArrayUtils import ArrayUtils
 from scripts.utils.internal.LoggerFactory import LoggerFactory
 from scripts.utils.MatlabUtils import MatlabUtils
 from scripts.utils.MatrixUtils import MatrixUtils
+from scripts.utils.internal.DataTypes import DataTypes
 from scripts.utils.internal.ProcessCache import ProcessCache
 from scripts.utils.internal.ProcessDataSaver import ProcessDataSaver
 
@@ -31,19 +34,59 @@ class PsEstGamma(MetaSubProcess):
 
     __FILE_NAME = "ps_est_gamma"
 
+    # In StaMPS random distribution is made from 300000 random pixels
+    DEFAULT_RAND_DIST_SIZE = 300000
+
+    # How many random pixels are found at once in random distribution (see __make_random_dist)
+    __RAND_DIST_BLOCK_SIZE = 20000
+    __RAND_DIST_SEED = 2005
+    # Change it when random distribution calculation changes. Then old cache files are not used
+    __RAND_DIST_CACHE_VERSION = 1
+
     def __init__(self, ps_files: PsFiles, rand_dist_cached_file=False,
-                 outter_rand_dist=np.array([])) -> None:
-        """rand_dist_cached_file= when True loads array of random numbers 'tmp_rand_dist' from cache
-        (see function 'self.__make_random_dist')
+                 outter_rand_dist=np.array([]), precision=DataTypes.PRECISION_DOUBLE,
+                 topofit_engine=PsTopofit.ENGINE_NUMPY, rand_dist_size=DEFAULT_RAND_DIST_SIZE,
+                 rand_dist_tolerance: float = None,
+                 topofit_search=PsTopofit.SEARCH_EXHAUSTIVE,
+                 topofit_refit_threshold: float = None,
+                 fft_backend=FftBackend.BACKEND_NUMPY, fft_workers=1, clap_workers=1) -> None:
+        """rand_dist_cached_file= when True loads random distribution from cache. Cache file name has
+        digest of all parameters that distribution depends on (see function
+        'self.__make_random_dist'), so there can be many distributions in cache
         outter_rand_dist = array of random numbers that are usually if found in function
-        'self.__make_random_dist'. This is used for testing"""
+        'self.__make_random_dist'. This is used for testing
+        precision = DataTypes.PRECISION_SINGLE or DataTypes.PRECISION_DOUBLE. With single
+        precision gridding, filtering and topofit are made with float32/ complex64 arrays
+        topofit_engine = PsTopofit.ENGINE_NUMPY or PsTopofit.ENGINE_NUMBA (see PsTopofit)
+        rand_dist_size = how many random pixels are used for random distribution. Distribution is
+        scaled before use, so it doesn't depend on number of PS candidates
+        rand_dist_tolerance = when set then random pixels are made block by block until
+        normalized random distribution changes less than that (but not more than rand_dist_size)
+        topofit_search = PsTopofit.SEARCH_EXHAUSTIVE or PsTopofit.SEARCH_COARSE_TO_FINE
+        topofit_refit_threshold = when set then in gamma loop topofit is found again only for
+        pixels which ph_patch has changed more than that (radians) since their last topofit.
+        Others keep their previous topofit results. When None all pixels are found every time
+        fft_backend, fft_workers = FFT backend and its threads in CLAP filtering (see FftBackend)
+        clap_workers = how many threads filter interferograms in gamma loop (see ClapFilt)"""
 
         self.__logger = LoggerFactory.create("PsEstGamma")
 
+        self.__precision = precision
+        self.__topofit_engine = PsTopofit.get_engine(topofit_engine)
+        self.__topofit_search = topofit_search
+        self.__topofit_refit_threshold = topofit_refit_threshold
+        self.__float_type = DataTypes.get_float_type(precision)
+        self.__complex_type = DataTypes.get_complex_type(precision)
+
         self.__ps_files = ps_files
         self.__set_internal_params()
+        self.__clap_filt = ClapFilt(self.__clap_alpha, self.__clap_beta, self.__clap_win,
+                                    precision, FftBackend(fft_backend, fft_workers),
+                                    clap_workers)
         self.rand_dist_cached = rand_dist_cached_file
         self.outter_rand_dist = outter_rand_dist
+        self.__rand_dist_size = rand_dist_size
+        self.__rand_dist_tolerance = rand_dist_tolerance
 
         # In StaMPS this is called 'coh_bins'
         self.coherence_bins = ArrayUtils.arange_include_last(0.005, 0.995, 0.01)
@@ -85,7 +128,7 @@ class PsEstGamma(MetaSubProcess):
         self.__logger.debug("nr_trial_wraps: {0}".format(self.nr_trial_wraps))
 
         # self.rand_dist in Stamps is named 'Nr'
-        self.rand_dist, self.nr_max_nz_ind = self.__make_random_dist(nr_ps, nr_ifgs, bperp_meaned,
+        self.rand_dist, self.nr_max_nz_ind = self.__make_random_dist(nr_ifgs, bperp_meaned,
                                                                      self.nr_trial_wraps)
         self.__logger.debug("rand_dist.len: {0}, self.nr_max_nz_ind: {1}"
                             .format(len(self.rand_dist), self.nr_max_nz_ind))
@@ -107,6 +150,8 @@ class PsEstGamma(MetaSubProcess):
                 nr_ifgs,
                 nr_ps,
                 self.nr_trial_wraps)
+        # Gamma loop is the only place where filtering threads are used
+        self.__clap_filt.close()
 
         self.__logger.info("End")
 
@@ -144,17 +189,8 @@ class PsEstGamma(MetaSubProcess):
         self.rand_dist = data['rand_dist']
 
     def __get_low_pass(self):
-        start = -(self.__clap_win) / self.__filter_grid_size / self.__clap_win / 2
-        stop = (self.__clap_win - 2) / self.__filter_grid_size / self.__clap_win / 2
-        step = 1 / self.__filter_grid_size / self.__clap_win
-        freg_i = ArrayUtils.arange_include_last(start, stop, step)
-
-        freg_0 = 1 / self.__clap_low_pass_wavelength
-
-        subtract = 1 + np.power(freg_i / freg_0, 10)
-        butter_i = np.divide(1, subtract)
-
-        return np.fft.fftshift(np.asmatrix(butter_i).conj().transpose() * butter_i)
+        return ClapFilt.get_low_pass(self.__clap_win, self.__filter_grid_size,
+                                     self.__clap_low_pass_wavelength)
 
     def __load_ps_params(self):
         """Loads needed parameters from ps_files object and takes what it needs"""
@@ -163,10 +199,15 @@ class PsEstGamma(MetaSubProcess):
         # In StaMPS small_basline=n
         nr_ifgs -= 1 # This is only for this process. In other proecesses nr_ifgs must remain unchanged
 
-        ph = MatrixUtils.delete_master_col(ph, self.__ps_files.master_nr)
-        ph_abs = np.abs(ph)
-        ph_abs[np.where(ph_abs == 0)] = 1 # Excluding the possibility of division by zero
-        ph = np.divide(ph, ph_abs)
+        # ph is read block by block, so there is only one (normalized) copy of it in memory. In
+        # out-of-core mode blocks are read from PsFiles store. Whole normalized ph is still in
+        # memory, because gamma loop uses all pixels in every iteration
+        ph = np.empty((nr_ps, nr_ifgs), ph.dtype)
+        for start, end, ph_block in self.__ps_files.iter_ph_blocks():
+            ph_block = MatrixUtils.delete_master_col(ph_block, self.__ps_files.master_nr)
+            ph_abs = np.abs(ph_block)
+            ph_abs[np.where(ph_abs == 0)] = 1 # Excluding the possibility of division by zero
+            ph[start:end] = np.divide(ph_block, ph_abs)
 
         # bprep_meaned is an array of rows (not columns), therefore usual
         # MatixUtils.delete_master_col function does not work
@@ -187,8 +228,10 @@ class PsEstGamma(MetaSubProcess):
         # todo why such formula?
         return bperp_range * max_k / (2 * math.pi)
 
-    def __make_random_dist(self, nr_ps, nr_ifgs, bperp_meaned, nr_trial_wraps):
-        CACHE_FILE_NAME = "tmp_rand_dist"
+    def __make_random_dist(self, nr_ifgs, bperp_meaned, nr_trial_wraps):
+        # Every distribution has its own cache file, so different stacks don't use each others
+        # distributions
+        CACHE_FILE_NAME = self.__get_rand_dist_cache_name(nr_ifgs, bperp_meaned, nr_trial_wraps)
 
         def use_cached_from_file():
             try:
@@ -197,7 +240,7 @@ class PsEstGamma(MetaSubProcess):
                 nr_max_nz_ind = loaded['nr_max_nz_ind']
 
             except FileNotFoundError:
-                self.__logger.info("No cache")
+                self.__logger.info("No cache '{0}'".format(CACHE_FILE_NAME))
 
                 rand_dist, nr_max_nz_ind = random_dist()
                 cache(rand_dist, nr_max_nz_ind)
@@ -215,22 +258,42 @@ class PsEstGamma(MetaSubProcess):
 
             return rand_dist, nr_max_nz_ind
 
-        def random_dist():
-            NR_RAND_IFGS = nr_ps  # In StaMPS it is 300000
-            random = np.random.RandomState(2005)
+        def is_converged(hist: np.ndarray, prev_hist: np.ndarray):
+            """Normalized histogram changes less than tolerance"""
+            if self.__rand_dist_tolerance is None or prev_hist is None:
+                return False
 
-            rnd_ifgs = 2 * math.pi * random.rand(NR_RAND_IFGS, nr_ifgs)
+            change = np.amax(np.abs(hist / np.sum(hist) - prev_hist / np.sum(prev_hist)))
+            return change < self.__rand_dist_tolerance
 
-            random_coherence = np.zeros((NR_RAND_IFGS, 1))
-            for i in range(NR_RAND_IFGS - 1, 0, -1):
-                phase = np.exp(1j * rnd_ifgs[i])
-                # We need only coherence here
-                _, coherence_0, _, _ = PsTopofit.ps_topofit_fun(phase, bperp_meaned, nr_trial_wraps)
-                random_coherence[i] = coherence_0[0]
-
-            del rnd_ifgs
-
-            hist, _ = MatlabUtils.hist(random_coherence, self.coherence_bins)
+        def random_dist():
+            NR_RAND_IFGS = self.__rand_dist_size
+            random = np.random.RandomState(self.__RAND_DIST_SEED)
+
+            get_coherence = PsTopofit.get_shared_bperp_coherence(bperp_meaned, nr_trial_wraps,
+                                                                 self.__precision)
+
+            # Random numbers are made block by block. RandomState gives same numbers than when
+            # they are made all at once
+            hist = np.zeros(len(self.coherence_bins), np.int64)
+            prev_hist = None
+            for start in range(0, NR_RAND_IFGS, self.__RAND_DIST_BLOCK_SIZE):
+                end = min(start + self.__RAND_DIST_BLOCK_SIZE, NR_RAND_IFGS)
+
+                rnd_ifgs = 2 * math.pi * random.rand(end - start, nr_ifgs)
+                random_coherence = get_coherence(np.exp(1j * rnd_ifgs))
+                if start == 0:
+                    # First random pixel is not used like in StaMPS loop. Coherence is zero then
+                    random_coherence[0] = 0
+
+                block_hist, _ = MatlabUtils.hist(random_coherence, self.coherence_bins)
+                hist += block_hist
+
+                if is_converged(hist, prev_hist):
+                    self.__logger.info("Random distribution converged after {0} random pixels"
+                                       .format(end))
+                    break
+                prev_hist = hist.copy()
 
             rand_dist = hist
 
@@ -246,6 +309,20 @@ class PsEstGamma(MetaSubProcess):
         else:
             return random_dist()
 
+    def __get_rand_dist_cache_name(self, nr_ifgs, bperp_meaned, nr_trial_wraps) -> str:
+        """Cache file name that has digest of all values that random distribution depends on"""
+        digest = hashlib.sha1()
+        # Block size is here because with rand_dist_tolerance distribution is checked after
+        # every block
+        digest.update("{0}|{1}|{2}|{3}|{4}|{5}|{6}|{7}".format(
+            self.__RAND_DIST_CACHE_VERSION, nr_ifgs, repr(float(nr_trial_wraps)),
+            self.__RAND_DIST_SEED, self.__rand_dist_size, self.__rand_dist_tolerance,
+            self.__precision, self.__RAND_DIST_BLOCK_SIZE).encode())
+        digest.update(np.ascontiguousarray(bperp_meaned, np.float64).tobytes())
+        digest.update(np.ascontiguousarray(self.coherence_bins, np.float64).tobytes())
+
+        return "rand_dist_{0}".format(digest.hexdigest())
+
     def __get_grid_ij(self, xy: np.ndarray):
 
         def fill_cols_with_xy_values(xy_col: np.ndarray):
@@ -262,13 +339,16 @@ class PsEstGamma(MetaSubProcess):
 
         grid_ij = np.zeros((len(xy), 2), np.int32)
 
+        # xy is DataTypes.XY (single precision). Differences are found in double precision
+        xy = xy.astype(np.float64)
         grid_ij[:, 0] = fill_cols_with_xy_values(xy[:, 1])
         grid_ij[:, 1] = fill_cols_with_xy_values(xy[:, 0])
 
         return grid_ij
 
     def __get_weights(self, da: np.ndarray):
-        return ArrayUtils.to_col_matrix(np.divide(1, da))
+        # da is DataTypes.DA (single precision). Weights are found in double precision
+        return ArrayUtils.to_col_matrix(np.divide(1, da.astype(np.float64)))
 
     def __sw_loop(self, ph: np.ndarray, weights: np.ndarray,
                   low_pass: np.ndarray, bprep: np.ndarray, nr_ifgs: int, nr_ps: int,
@@ -276,69 +356,92 @@ class PsEstGamma(MetaSubProcess):
 
         SW_ARRAY_SHAPE = (nr_ps, 1)
 
+        # In double precision these don't make copies
+        bprep = bprep.astype(self.__float_type, copy=False)
+
         def zero_ps_array_cont():
             """Konstruktor tühja pusivpeegeladajate info massiivi loomiseks"""
             return np.zeros(SW_ARRAY_SHAPE)
 
         def get_ph_weight(bprep, k_ps, nr_ifgs, ph, weights):
+            k_ps = k_ps.astype(self.__float_type, copy=False)
+            weights = weights.astype(self.__float_type, copy=False)
+
             exped = np.exp(np.multiply((-1j * bprep), np.tile(k_ps, (1, nr_ifgs))))
             exp_tiled_weight_multi = np.multiply(exped, np.tile(weights, (1, nr_ifgs)))
             return np.multiply(ph, exp_tiled_weight_multi)
 
+        def get_refit_ind(ph_patch: np.ndarray, fitted_ph_patch: np.ndarray) -> np.ndarray:
+            """Pixels which topofit is found again. These are pixels which ph_patch has changed
+            more than threshold since their last topofit or all pixels"""
+            if self.__topofit_refit_threshold is None or fitted_ph_patch is None:
+                return np.arange(nr_ps)
+
+            ph_patch_change = np.amax(np.abs(np.angle(ph_patch * fitted_ph_patch.conj())), axis=1)
+            # Angle doesn't change when zero patch becomes non zero
+            is_zeros_changed = np.any((ph_patch == 0) != (fitted_ph_patch == 0), axis=1)
+
+            return np.flatnonzero((ph_patch_change > self.__topofit_refit_threshold)
+                                  | is_zeros_changed)
+
         def is_gamma_in_change_delta():
             return abs(gamma_change_delta) < self.__gamma_change_convergence
 
-        def make_ph_grid(ph_grid_shape: tuple, grid_ij: np.ndarray, weights: np.ndarray,
-                         loop_nr: int) -> np.ndarray:
-            # np.complex128 is needed because this is the type that pydsm.relab.shiftdim returns.
-            # ph_grid and ph_filt are needed to make again. Otherwise there are old values in those
-            # arrays
-            ph_grid = np.zeros(ph_grid_shape, np.complex128)
-            for id in range(loop_nr):
-                x_ind = int(grid_ij[id, 0]) - 1
-                y_ind = int(grid_ij[id, 1]) - 1
-                ph_grid[x_ind, y_ind, :] += pydsm.relab.shiftdim(weights[id, :], -1, nargout=1)[0]
-
-            return ph_grid
-
-        def make_ph_filt(ph_grid_shape: tuple, ph_grid: np.ndarray, loop_nr: int,
-                         low_pass: np.ndarray) -> np.ndarray:
-            ph_filt = np.zeros(ph_grid_shape, np.complex128)
-            for i in range(loop_nr):
-                ph_filt[:, :, i] = self.__clap_filt(ph_grid[:, :, i], low_pass)
-
-            return ph_filt
-
-        def make_ph_path(ph_patch: np.ndarray, ph_filt: np.ndarray, grid_ij: np.ndarray,
-                         loop_nr: int) -> np.ndarray:
-            for i in range(loop_nr):
-                x_ind = int(grid_ij[i, 0]) - 1
-                y_ind = int(grid_ij[i, 1]) - 1
-                ph_patch[i, :nr_ifgs] = np.squeeze(ph_filt[x_ind, y_ind, :])
-
-            not_zero_patches_ind = np.nonzero(ph_patch)
-            ph_patch[not_zero_patches_ind] = np.divide(ph_patch[not_zero_patches_ind],
-                                                       np.abs(ph_patch[not_zero_patches_ind]))
+        def make_ph_grid(ph_grid_shape: tuple, grid_cell_ind: np.ndarray,
+                         weights: np.ndarray) -> np.ndarray:
+            """Sums pixels weights to grid cells. Flattened (cells, ifgs) array is summed with
+            bincount, real and imaginary part separately. Pixels are summed in same order as
+            they are in weights. ph_grid and ph_filt are needed to make again. Otherwise there
+            are old values in those arrays"""
+            nr_ifgs = ph_grid_shape[2]
+            nr_values = ph_grid_shape[0] * ph_grid_shape[1] * nr_ifgs
+            value_ind = (grid_cell_ind[:, np.newaxis] * nr_ifgs + np.arange(nr_ifgs)).ravel()
+
+            ph_grid = np.empty(nr_values, self.__complex_type)
+            ph_grid.real = np.bincount(value_ind, weights.real.ravel(), nr_values)
+            ph_grid.imag = np.bincount(value_ind, weights.imag.ravel(), nr_values)
+
+            return ph_grid.reshape(ph_grid_shape)
+
+        def make_ph_filt(ph_grid: np.ndarray, low_pass: np.ndarray) -> np.ndarray:
+            return self.__clap_filt.filter_grid(ph_grid, low_pass)
+
+        def make_ph_path(ph_patch: np.ndarray, ph_filt: np.ndarray,
+                         grid_cell_ind: np.ndarray) -> np.ndarray:
+            """Pixels filtered phases from their grid cells, normalized. ph_patch is reused, values
+            are written straight to it"""
+            np.take(ph_filt.reshape(-1, ph_filt.shape[2]), grid_cell_ind, axis=0, out=ph_patch)
+
+            ph_patch_abs = np.abs(ph_patch)
+            np.divide(ph_patch, ph_patch_abs, out=ph_patch, where=ph_patch_abs != 0)
 
             return ph_patch
 
         nr_i = int(np.max(self.grid_ij[:, 0]))
         nr_j = int(np.max(self.grid_ij[:, 1]))
         PH_GRID_SHAPE = (nr_i, nr_j, nr_ifgs)
+        # Pixels grid cells indexes in flattened (nr_i, nr_j) grid
+        grid_cell_ind = np.ravel_multi_index(
+            (self.grid_ij[:, 0].astype(np.intp) - 1, self.grid_ij[:, 1].astype(np.intp) - 1),
+            (nr_i, nr_j))
 
         coh_ps_result = zero_ps_array_cont()
         gamma_change = 0
         gamma_change_delta = np.inf
 
-        ph_patch = np.zeros(ph.shape, np.complex128)
+        ph_patch = np.zeros(ph.shape, self.__complex_type)
 
         k_ps = zero_ps_array_cont()
 
         # Est topo error
         # Initializing variables that are returned in the end
         c_ps = zero_ps_array_cont()
+        coh_ps = zero_ps_array_cont()
         n_opt = zero_ps_array_cont()
-        ph_res = np.zeros((nr_ps, nr_ifgs))
+        ph_res = np.zeros((nr_ps, nr_ifgs), self.__float_type)
+
+        # ph_patch that was used in last topofit of every pixel
+        fitted_ph_patch = None
 
         log_i = 0 # Used for logging to see how many cycles we have done
         self.__logger.debug("is_gamma_in_change_delta loop begin")
@@ -347,13 +450,13 @@ class PsEstGamma(MetaSubProcess):
             self.__logger.debug("gamma change loop i " + str(log_i))
             ph_weight = get_ph_weight(bprep, k_ps, nr_ifgs, ph, weights)
 
-            ph_grid = make_ph_grid(PH_GRID_SHAPE, self.grid_ij, ph_weight, nr_ps)
-            ph_filt = make_ph_filt(PH_GRID_SHAPE, ph_grid, nr_ifgs, low_pass)
+            ph_grid = make_ph_grid(PH_GRID_SHAPE, grid_cell_ind, ph_weight)
+            ph_filt = make_ph_filt(ph_grid, low_pass)
 
             self.__logger.debug("ph_filt found. first row: {0}, last row: {1}"
                                 .format(ph_filt[0], ph_filt[len(ph_filt) - 1]))
 
-            ph_patch = make_ph_path(ph_patch, ph_filt, self.grid_ij, nr_ps)
+            ph_patch = make_ph_path(ph_patch, ph_filt, grid_cell_ind)
 
             self.__logger.debug("ph_patch found. first row: {0}, last row: {1}"
                                 .format(ph_patch[0], ph_patch[len(ph_patch) - 1]))
@@ -361,18 +464,43 @@ class PsEstGamma(MetaSubProcess):
             del ph_filt
 
             # This is the slowest part in this process
-            topofit = PsTopofit(SW_ARRAY_SHAPE, nr_ps, nr_ifgs)
-            topofit.ps_topofit_loop(ph, ph_patch, bprep, nr_trial_wraps)
-            k_ps = topofit.k_ps.copy()
-            c_ps = topofit.c_ps.copy()
-            coh_ps = topofit.coh_ps.copy()
-            n_opt = topofit.n_opt.copy()
-            ph_res = topofit.ph_res.copy()
+            refit_ind = get_refit_ind(ph_patch, fitted_ph_patch)
+            nr_refit = len(refit_ind)
+            if nr_refit == nr_ps:
+                # All pixels are found, so there is no need to copy arrays
+                refit_ph, refit_ph_patch, refit_bprep = ph, ph_patch, bprep
+            else:
+                refit_ph = ph[refit_ind]
+                refit_ph_patch = ph_patch[refit_ind]
+                refit_bprep = bprep[refit_ind]
+
+            topofit = PsTopofit((nr_refit, 1), nr_refit, nr_ifgs, self.__precision,
+                                self.__topofit_engine, self.__topofit_search)
+            topofit.ps_topofit_loop(refit_ph, refit_ph_patch, refit_bprep, nr_trial_wraps)
+            del refit_ph, refit_ph_patch, refit_bprep
+
+            # New arrays, because coh_ps_result is previous coh_ps
+            k_ps = k_ps.copy()
+            c_ps = c_ps.copy()
+            coh_ps = coh_ps.copy()
+            n_opt = n_opt.copy()
+            k_ps[refit_ind] = topofit.k_ps
+            c_ps[refit_ind] = topofit.c_ps
+            coh_ps[refit_ind] = topofit.coh_ps
+            n_opt[refit_ind] = topofit.n_opt
+            ph_res[refit_ind] = topofit.ph_res
+
+            if self.__topofit_refit_threshold is not None:
+                if fitted_ph_patch is None:
+                    fitted_ph_patch = ph_patch.copy()
+                else:
+                    fitted_ph_patch[refit_ind] = ph_patch[refit_ind]
+
+            self.__logger.debug("topofit found for {0} pixels. Trials per pixel {1}".format(
+                nr_refit, topofit.nr_evaluated_trials / max(nr_refit, 1)))
 
             del topofit
 
-            self.__logger.debug("topofit found")
-
             gamma_change_rms = np.sqrt(np.sum(np.power(coh_ps - coh_ps_result, 2) / nr_ps))
             gamma_change_delta = gamma_change_rms - gamma_change
             # Saving gamma and coherence that are returned later to temp variables
@@ -417,113 +545,3 @@ class PsEstGamma(MetaSubProcess):
                 weights = np.reshape(np.power(1 - ps_rand, 2), SW_ARRAY_SHAPE)
 
         return ph_patch, k_ps, c_ps, coh_ps_result, n_opt, ph_res, ph_grid, low_pass
-
-    def __clap_filt(self, ph: np.ndarray, low_pass: np.ndarray):
-        """CLAP_FILT Combined Low-pass Adaptive Phase filtering.
-        Variables nr_win, nr_pad where inputs in StaMPS but these were multiplied before inputing
-        into function. Here it is done internally.
-        Also clap_alpha ja clap_beta where inputs but in this case those are global class variables
-        so we can use them and don't need for inputs"""
-
-        def create_grid(nr_win: int):
-            grid_array = ArrayUtils.arange_include_last(0, (nr_win / 2) - 1)
-            grid_x, grid_y = np.meshgrid(grid_array, grid_array)
-            grid = grid_x + grid_y
-
-            return grid
-
-        # todo What does wind_func mean? This isn't array of functions
-        def make_wind_func(grid: np.ndarray):
-            WIND_FUNC_TYPE = np.float64
-            wind_func = np.array(np.append(grid, np.fliplr(grid), axis=1), WIND_FUNC_TYPE)
-            wind_func = np.array(np.append(wind_func, np.flipud(wind_func), axis=0), WIND_FUNC_TYPE)
-            # In order to prevent zeros in corners
-            wind_func += 1e-6
-
-            return wind_func
-
-        def get_indexes(loop_index: int, inc: int, nr_win: int) -> (int, int):
-            i1 = loop_index * inc
-            # We don't do -1 because otherwise last element in array is not selected
-            i2 = i1 + nr_win
-
-            return i1, i2
-
-        FILTERED_TYPE = np.complex128
-        filtered = np.zeros(ph.shape, FILTERED_TYPE)
-
-        ph = np.nan_to_num(ph)
-
-        nr_win = int(self.__clap_win * 0.75)
-        nr_pad = int(self.__clap_win * 0.25)
-
-        ph_i_len = ph.shape[0] - 1
-        ph_j_len = ph.shape[1] - 1
-        nr_inc = int(np.floor(nr_win / 4))
-        # Indices begin from zero on Python. That's why those values are greater than StaMPS
-        nr_win_i = int(np.ceil(ph_i_len / nr_inc) - 3)
-        nr_win_j = int(np.ceil(ph_j_len / nr_inc) - 3) + 1
-
-        wind_func = make_wind_func(create_grid(nr_win))
-
-        # To make transpose work like Matlab we need to convert those to matrix
-        # todo: PsSelect has similar thing
-        B = np.multiply(np.asmatrix(MatlabUtils.gausswin(7)),
-                        np.asmatrix(MatlabUtils.gausswin(7)).transpose())
-
-        nr_win_pad_sum = (nr_win + nr_pad)
-        ph_bit = np.zeros((nr_win_pad_sum, nr_win_pad_sum), FILTERED_TYPE)
-        # Todo: Refactor
-        for i in range(nr_win_i):
-            w_f = wind_func.copy()
-            i1, i2 = get_indexes(i, nr_inc, nr_win)
-
-            if i2 > ph_i_len:
-                i_shift = i2 - ph_i_len - 1
-                i2 = ph_i_len + 1
-                i1 = ph_i_len - nr_win + 1
-                w_f = np.append(np.zeros((i_shift, nr_win)), w_f[:nr_win - i_shift, :],
-                                axis=0).astype(FILTERED_TYPE)
-
-            for j in range(nr_win_j):
-                w_f2 = w_f
-                j1, j2 = get_indexes(j, nr_inc, nr_win)
-
-                if j2 > ph_j_len:
-                    j_shift = j2 - ph_j_len - 1
-                    # Because array lenghts, ph_i_len and ph_j_len, are already smaller and Numpy
-                    # does not take last index when selecting, then we need to add one more
-                    j2 = ph_j_len + 1
-                    j1 = ph_j_len - nr_win + 1
-                    w_f2 = np.append(np.zeros((nr_win, j_shift)), w_f2[:, :nr_win - j_shift],
-                                     axis=1).astype(FILTERED_TYPE)
-
-                ph_bit[:nr_win, :nr_win] = ph[i1: i2, j1: j2]
-
-                ph_fft = np.fft.fft2(ph_bit) # todo Todo from fifth decimal point the values are not equal to Stamps result
-                # ph_fft = fftw.interfaces.numpy_fft.fft2(ph_bit) #  todo Todo from fifth decimalpoint the values are not equal to Stamps result
-                smooth_resp = np.abs(ph_fft) # 'H' in Stamps
-                smooth_resp = np.fft.ifftshift(
-                    MatlabUtils.filter2(B, np.fft.ifftshift(smooth_resp)))
-                # smooth_resp = fftw.interfaces.numpy_fft.ifftshift(
-                #     MatlabUtils.filter2(B, fftw.interfaces.numpy_fft.ifftshift(smooth_resp)))
-                mean_smooth_resp = np.median(smooth_resp)
-
-                if mean_smooth_resp != 0:
-                    smooth_resp /= mean_smooth_resp
-
-                smooth_resp = np.power(smooth_resp, self.__clap_alpha)
-
-                # todo Values under median to zero. Why that?
-                smooth_resp -= 1
-                smooth_resp[smooth_resp < 0] = 0
-
-                # todo What is G?
-                G = smooth_resp * self.__clap_beta + low_pass
-                ph_filt = np.fft.ifft2(np.multiply(ph_fft, G))
-                # ph_filt = fftw.interfaces.numpy_fft.ifft2(np.multiply(ph_fft, G))
-                ph_filt = np.multiply(ph_filt[:nr_win, :nr_win], w_f2)
-
-                filtered[i1:i2, j1:j2] += ph_filt
-
-        return filtered
@@ -1,23 +1,25 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from pathlib import Path
 
 import re
 from typing import Callable
 
-from numpy import matlib
-
 from scripts.MetaSubProcess import MetaSubProcess
 from scripts.processes.CreateLonLat import CreateLonLat
 from scripts.utils.ArrayUtils import ArrayUtils
+from scripts.utils.internal.ChunkedArrayStore import ChunkedArrayStore
+from scripts.utils.internal.DataTypes import DataTypes
 from scripts.utils.internal.FolderConstants import FolderConstants
 
 import numpy as np
 import math
 
 from scripts.utils.internal.LoggerFactory import LoggerFactory
+from scripts.utils.internal.MetadataCache import MetadataCache
+from scripts.utils.internal.PatchFileReader import PatchFileReader
 from scripts.utils.MatlabUtils import MatlabUtils
-from scripts.utils.MatrixUtils import MatrixUtils
 from scripts.utils.internal.ProcessDataSaver import ProcessDataSaver
 
 
@@ -36,23 +38,36 @@ class PsFiles(MetaSubProcess):
     ll: np.ndarray
     xy: np.ndarray
     da: np.ndarray
-    sort_ind: np.matrix  # In Stamps this is la from la1.mat
+    sort_ind: np.ndarray  # In Stamps this is la from la1.mat. Column array
     master_date: date
     ifgs: np.ndarray  # todo to private variable?
     hgt: np.ndarray
     ifg_dates: list = []  # 'day' in Stamps
 
     __FILE_NAME = "ps_files"
+    # Folder name in store_path where ph and bperp are saved in out-of-core mode
+    __STORE_FOLDER_NAME = "ps_files_store"
+
+    def __init__(self, path: str, create_lonlat: CreateLonLat, out_of_core=False,
+                 store_path: str = None,
+                 patch_folder_name: str = FolderConstants.PATCH_FOLDER_NAME):
+        """out_of_core = when True then ph and bperp arrays are not held in memory. Those are
+        written block by block to ChunkedArrayStore in store_path (usually save_load_path) and
+        later processes read them from there as memmaps. PsSelect and PsWeed read only rows of
+        selected pixels. PsEstGamma reads ph with iter_ph_blocks, but it holds whole normalized
+        ph in memory for gamma loop, so it is not out-of-core.
+        store_path = where on-disk store is made. Needed only when out_of_core is True
+        patch_folder_name = PATCH folder in path that is processed"""
 
-    def __init__(self, path: str, create_lonlat: CreateLonLat):
         # Parameters that are read from different files and are needed in other processes
 
         self.__path = Path(path)
-        self.__patch_path = Path(path, FolderConstants.PATCH_FOLDER_NAME)
+        self.__patch_path = Path(path, patch_folder_name)
 
-        # Because there are only two parameters to load we can do it here, in constructor
-        self.pscands_ij = np.asmatrix(create_lonlat.pscands_ij)
-        self.lonlat = np.asmatrix(create_lonlat.lonlat)
+        # Because there are only two parameters to load we can do it here, in constructor.
+        # Those are None when PsFiles is made only for loading results
+        self.pscands_ij = create_lonlat.pscands_ij
+        self.lonlat = create_lonlat.lonlat
 
         if not self.__path.exists():
             raise FileNotFoundError("No PATCH folder. Load abs.path '{0}'".format(
@@ -61,11 +76,19 @@ class PsFiles(MetaSubProcess):
             raise FileNotFoundError(
                 "No PATCH folder. Load abs.path '{0}'".format(
                     str(self.__patch_path.absolute())))
-        if self.pscands_ij is None:
-            raise AttributeError("pscands_ij_array is None")
 
         self.__logger = self.__logger = LoggerFactory.create("PsFiles")
 
+        self.out_of_core = out_of_core
+        if out_of_core:
+            if store_path is None:
+                raise AttributeError("store_path is None. It is needed in out_of_core mode")
+            self.__store = ChunkedArrayStore(os.path.join(store_path, self.__STORE_FOLDER_NAME))
+        else:
+            self.__store = None
+
+        self.__metadata_cache = MetadataCache(FolderConstants.METADATA_CACHE_PATH)
+
     def start_process(self):
         self.__logger.info("Start")
 
@@ -88,15 +111,20 @@ class PsFiles(MetaSubProcess):
 
         sat_look_angle = self.__get_look_angle(rg, params)
 
-        self.bperp_meaned, self.bperp = self.__get_bprep(self.ifgs, sat_look_angle, params)
+        self.xy, sort_ind = self.__get_xy()
 
-        self.mean_incidence = self.__get_meaned_incidence(rg, params)
+        if self.out_of_core:
+            self.bperp_meaned, self.bperp = self.__get_bprep_out_of_core(
+                self.ifgs, sat_look_angle, params, sort_ind)
+        else:
+            self.bperp_meaned, self.bperp = self.__get_bprep(self.ifgs, sat_look_angle, params)
 
-        self.ph = self.__get_ph(len(self.ifgs))
+        self.mean_incidence = self.__get_meaned_incidence(rg, params)
 
         self.ll = self.__get_ll_array()
 
-        self.xy, sort_ind = self.__get_xy()
+        # ph is sorted already when loading, so it isn't sorted again in __sort_results
+        self.ph = self.__get_ph(len(self.ifgs), sort_ind)
 
         self.da = self.__get_da()
 
@@ -107,15 +135,27 @@ class PsFiles(MetaSubProcess):
         self.__logger.info("End")
 
     def save_results(self, save_path: str):
+        if self.out_of_core:
+            # ph and bperp are already in store. Those are loaded from there
+            ph = np.array([])
+            bperp = np.array([])
+            store_path = self.__store.store_path
+        else:
+            ph = self.ph
+            bperp = self.bperp
+            store_path = ''
+
         ProcessDataSaver(save_path, self.__FILE_NAME).save_data(
+            out_of_core=self.out_of_core,
+            store_path=store_path,
             heading=self.heading,
             mean_range=self.mean_range,
             wavelength=self.wavelength,
             mean_incidence=self.mean_incidence,
             master_nr=self.master_nr,
             bprep_meaned=self.bperp_meaned,
-            bperp=self.bperp,
-            ph=self.ph,
+            bperp=bperp,
+            ph=ph,
             ll=self.ll,
             xy=self.xy,
             da=self.da,
@@ -135,8 +175,16 @@ class PsFiles(MetaSubProcess):
         self.mean_incidence = data['mean_incidence']
         self.master_nr = data['master_nr']
         self.bperp_meaned = data['bprep_meaned']
-        self.bperp = data['bperp']
-        self.ph = data['ph']
+        # Saves that are made before out-of-core mode don't have that key
+        if 'out_of_core' in data.files and data['out_of_core']:
+            self.out_of_core = True
+            self.__store = ChunkedArrayStore(str(data['store_path']))
+            self.bperp = self.__store.open('bperp')
+            self.ph = self.__store.open('ph')
+        else:
+            self.out_of_core = False
+            self.bperp = data['bperp']
+            self.ph = data['ph']
         self.ll = data['ll']
         self.xy = data['xy']
         self.da = data['da']
@@ -155,60 +203,88 @@ class PsFiles(MetaSubProcess):
         """Here we find bprep_meaned and bprep_arr that were in Stamps accordingly bperp
         and bperp_mat. Saving both of variables just in case.
 
-        In StaMPS ij file where loaded locally and calculations where done with matrix third column.
-        In Python this process is too slow (about 30 seconds)."""
-        ARRAY_TYPE = np.float64
-
-        cos_sat_look_angle = np.cos(sat_look_angle)
-        sin_sat_look_angle = np.sin(sat_look_angle)
+        bperp is found for all interferograms with one broadcast so master column (column where
+        are persistent scatterers) is not made at all. Master column is found separately only for
+        bprep_meaned."""
 
-        mean_azimuth_line = float(params['azimuth_lines']) / 2 - 0.5
+        tcn, baseline_rate = self.__get_baseline_params_arrays(ifgs)
+        ifg_ind = self.__get_not_master_ind(len(ifgs))
 
         ij_lon = self.pscands_ij[:, 1]
-        nr_ifgs = len(ifgs)
-        bperp = matlib.zeros((len(self.pscands_ij), nr_ifgs), dtype=ARRAY_TYPE)
 
-        bc_bn_formula = lambda tcn, baseline_rate: tcn + baseline_rate * (
-                ij_lon - mean_azimuth_line) / float(params['prf'])
+        bperp = self.__get_bperp_rows(tcn[ifg_ind], baseline_rate[ifg_ind], ij_lon,
+                                      sat_look_angle, params)
+        bperp_master = self.__get_bperp_rows(tcn[[self.master_nr - 1]],
+                                             baseline_rate[[self.master_nr - 1]], ij_lon,
+                                             sat_look_angle, params)
 
-        for i in range(nr_ifgs):
-            tcn, baseline_rate = self.__get_baseline_params(ifgs[i])
+        bprep_meaned = np.insert(np.mean(bperp, 0), self.master_nr - 1, np.mean(bperp_master))
 
-            bc = bc_bn_formula(tcn[1], baseline_rate[1])
-            bn = bc_bn_formula(tcn[2], baseline_rate[2])
-            bprep_line = np.multiply(bc, cos_sat_look_angle) - np.multiply(bn, sin_sat_look_angle)
-            bperp[:, i] = bprep_line
+        return bprep_meaned, bperp
 
-        bprep_meaned = np.mean(bperp, 0).transpose()
-        # Removing master column (column where are persistent scatterers)
-        bperp = MatrixUtils.delete_master_col(bperp, self.master_nr)
+    def __get_bprep_out_of_core(self, ifgs: np.ndarray, sat_look_angle: np.ndarray, params: dict,
+                                sort_ind: np.ndarray):
+        """Same as __get_bprep but bperp is found block by block, already sorted with sort_ind,
+        and written to store. bprep_meaned is found from column sums of those blocks."""
 
-        # Return array not matrix
-        return ArrayUtils.matrix_to_array(bprep_meaned), ArrayUtils.matrix_to_array(bperp)
+        tcn, baseline_rate = self.__get_baseline_params_arrays(ifgs)
+        ifg_ind = self.__get_not_master_ind(len(ifgs))
 
-    def __get_ph(self, nr_ifgs):
-        """pscands.1.ph file load. In this file there are complex binary numbers"""
-        BINARY_COMPLEX_TYPE = np.dtype('>c8')  # "big-endian" 64bit complex
+        ij_lon = self.pscands_ij[:, 1]
+        nr_ps = len(ij_lon)
+
+        bperp = self.__store.create('bperp', (nr_ps, len(ifg_ind)), np.float64)
+        bperp_sum = np.zeros(len(ifgs))
+        for start in range(0, nr_ps, self.__store.block_size):
+            rows = sort_ind[start:min(start + self.__store.block_size, nr_ps)]
+            bperp_block = self.__get_bperp_rows(tcn, baseline_rate, ij_lon[rows],
+                                                sat_look_angle[rows], params)
+
+            bperp_sum += np.sum(bperp_block, 0)
+            bperp[start:start + len(rows)] = bperp_block[:, ifg_ind]
+        bperp.flush()
+
+        return bperp_sum / nr_ps, bperp
+
+    def __get_not_master_ind(self, nr_ifgs: int) -> np.ndarray:
+        """Indexes of interferograms without master"""
+        return np.delete(np.arange(nr_ifgs), self.master_nr - 1)
+
+    # noinspection PyMethodMayBeStatic
+    def __get_bperp_rows(self, tcn: np.ndarray, baseline_rate: np.ndarray, ij_lon: np.ndarray,
+                         sat_look_angle: np.ndarray, params: dict) -> np.ndarray:
+        """bperp values for pixels which azimuth lines are ij_lon. tcn and baseline_rate are
+        (nr_ifgs, 3) arrays and result is (len(ij_lon), nr_ifgs) array. Calculations are made in
+        place so there is only one temporary array in size of the result."""
+        ARRAY_TYPE = np.float64
 
-        COMPLEX_TYPE = np.complex64
+        mean_azimuth_line = float(params['azimuth_lines']) / 2 - 0.5
+        azimuth_time = ((ij_lon - mean_azimuth_line) / float(params['prf']))[:, np.newaxis]
+        sat_look_angle = sat_look_angle[:, np.newaxis]
 
-        path_to_ph = self.__patch_path.joinpath("pscands.1.ph")
+        # bc * cos(sat_look_angle)
+        bperp = np.multiply(azimuth_time, baseline_rate[:, 1], dtype=ARRAY_TYPE)
+        bperp += tcn[:, 1]
+        bperp *= np.cos(sat_look_angle)
 
-        with path_to_ph.open("rb") as file:
-            imag_array_raw = np.fromfile(file, BINARY_COMPLEX_TYPE)
+        # bn * sin(sat_look_angle)
+        bn = np.multiply(azimuth_time, baseline_rate[:, 2], dtype=ARRAY_TYPE)
+        bn += tcn[:, 2]
+        bn *= np.sin(sat_look_angle)
 
-        imag_mx_len = int(len(imag_array_raw) / nr_ifgs)
-        imag_list = []
-        count = 0
-        for i in range(0, len(imag_array_raw), imag_mx_len):
-            matrix_row = imag_array_raw[i:i + imag_mx_len]
-            if count == self.master_nr - 1:
-                matrix_row = np.ones((imag_mx_len), dtype=COMPLEX_TYPE)
-            imag_list.append(matrix_row)
+        bperp -= bn
 
-            count += 1
+        return bperp
 
-        return np.asarray(imag_list, COMPLEX_TYPE).transpose()
+    def __get_ph(self, nr_ifgs: int, sort_ind: np.ndarray):
+        """pscands.1.ph file load. In this file there are complex binary numbers"""
+        if self.out_of_core:
+            ph = self.__store.create('ph', (len(sort_ind), nr_ifgs), DataTypes.PH)
+            PatchFileReader.load_ph(self.__patch_path, nr_ifgs, self.master_nr, sort_ind, ph)
+            ph.flush()
+            return ph
+        else:
+            return PatchFileReader.load_ph(self.__patch_path, nr_ifgs, self.master_nr, sort_ind)
 
     def __get_meaned_incidence(self, rg: np.ndarray, params: dict):
         sar_to_earth_center_sq = math.pow(float(params['sar_to_earth_center']), 2)
@@ -221,14 +297,34 @@ class PsFiles(MetaSubProcess):
                 (2 * float(params['earth_radius_below_sensor']) * rg)))
         return incidence.mean()
 
+    def __get_baseline_params_arrays(self, ifgs: np.ndarray):
+        """Reads all .base files in threads (most of the time goes to waiting file system) and
+        returns tcn and baseline_rate as (nr_ifgs, 3) arrays. Results are cached."""
+
+        def load_baseline_params():
+            with ThreadPoolExecutor() as executor:
+                baseline_params = list(executor.map(self.__get_baseline_params, ifgs))
+
+            return {'tcn': np.array([params[0] for params in baseline_params], dtype=np.float64),
+                    'baseline_rate': np.array([params[1] for params in baseline_params],
+                                              dtype=np.float64)}
+
+        base_file_paths = [self.__get_base_file_path(ifg) for ifg in ifgs]
+        loaded = self.__metadata_cache.get("baselines", base_file_paths, load_baseline_params)
+
+        return loaded['tcn'], loaded['baseline_rate']
+
+    # noinspection PyMethodMayBeStatic
+    def __get_base_file_path(self, ifg_name: np.str_) -> Path:
+        name_and_ext = ifg_name.split(".")
+        return Path(name_and_ext[0] + ".base")
+
     def __get_baseline_params(self, ifg_name: np.str_):
         """Returns two parameters: tcn (initial baseline) ja baseline_rate.
         These are find in .base files. For every interferogram there is one file.
         There is array sized three each one of these."""
 
-        name_and_ext = ifg_name.split(".")
-        base_file_name = name_and_ext[0] + ".base"
-        path = Path(base_file_name)
+        path = self.__get_base_file_path(ifg_name)
 
         if path.exists():
             tcn = None
@@ -247,11 +343,21 @@ class PsFiles(MetaSubProcess):
 
             return tcn, baseline_rate
         else:
-            raise FileNotFoundError(base_file_name + " not found.")
+            raise FileNotFoundError(str(path) + " not found.")
 
     def __load_params_from_rsc_file(self) -> dict:
-        """From this file we read satellite metadata. Loaded params are put into dict and returned"""
+        """From this file we read satellite metadata. Loaded params are put into dict and returned.
+        Params are cached and rsc.txt and .rslc.par file are parsed only when those are changed."""
+
+        with self.__load_file("rsc.txt", self.__path) as rsc_file:
+            rsc_par_file_abs_path = rsc_file.read().strip()
+
+        return self.__metadata_cache.get(
+            "rsc_params", [Path(self.__path, "rsc.txt"), Path(rsc_par_file_abs_path)],
+            lambda: self.__parse_rsc_par_file(Path(rsc_par_file_abs_path)))
 
+    # noinspection PyMethodMayBeStatic
+    def __parse_rsc_par_file(self, rsc_par_file: Path) -> dict:
         params = {}
 
         ALLOWED_PARAMS = ["azimuth_lines",
@@ -267,33 +373,29 @@ class PsFiles(MetaSubProcess):
                           "date"]
 
         value_regex = re.compile(r"-?[\d*.]+")
-        with self.__load_file("rsc.txt", self.__path) as rsc_file:
-            rsc_par_file_abs_path = rsc_file.read().strip()
-
-            rsc_par_file = Path(rsc_par_file_abs_path)
-            if rsc_par_file.exists():
-                with rsc_par_file.open() as rsc_par:
-                    for line in rsc_par:
-                        # This is last parameter. After that we can stop processing
-                        if line == "state_vector_position_1":
-                            break
+        if rsc_par_file.exists():
+            with rsc_par_file.open() as rsc_par:
+                for line in rsc_par:
+                    # This is last parameter. After that we can stop processing
+                    if line == "state_vector_position_1":
+                        break
 
-                        splited = line.split(':')
-                        key = splited[0]
+                    splited = line.split(':')
+                    key = splited[0]
 
-                        if key in ALLOWED_PARAMS:
-                            if key == 'date':
-                                # If not seprated with coma or is not string then removes spaces
-                                value = re.sub("[\t\n\v]", "", splited[1])
-                            else:
-                                value = value_regex.findall(splited[1])[0]
+                    if key in ALLOWED_PARAMS:
+                        if key == 'date':
+                            # If not seprated with coma or is not string then removes spaces
+                            value = re.sub("[\t\n\v]", "", splited[1])
+                        else:
+                            value = value_regex.findall(splited[1])[0]
 
-                            params[key] = value
-            else:
-                raise FileNotFoundError(
-                    "No file. Abs.path '" + str(rsc_par_file.absolute()) + "'")
+                        params[key] = value
+        else:
+            raise FileNotFoundError(
+                "No file. Abs.path '" + str(rsc_par_file.absolute()) + "'")
 
-            return params
+        return params
 
     def __get_master_date(self, params: dict):
         """'date' is from load_params_from_rsc_file and is master date. We split that string here
@@ -315,8 +417,10 @@ class PsFiles(MetaSubProcess):
 
         path = self.__path.joinpath("pscphase.in")
         if path.exists():
-            pscphase = np.genfromtxt(str(path), dtype=str, skip_header=True)
-            return pscphase
+            loaded = self.__metadata_cache.get(
+                "pscphase", [path],
+                lambda: {'ifgs': np.genfromtxt(str(path), dtype=str, skip_header=True)})
+            return loaded['ifgs']
         else:
             raise FileNotFoundError("pscphase.in not found. AbsPath {0}".format(
                 str(path.absolute())))
@@ -334,33 +438,32 @@ class PsFiles(MetaSubProcess):
         """ij array is taken last two columns that are x an y.
         This is multiplied with scalar, fixes data by rotating image and later sorted by y column.
         Here we additionally also add sorting index column that other arrays can use."""
-        xy = np.fliplr(self.pscands_ij.copy())[:, 0:2]
+        # pscands_ij is int32 array. Multiplying it later may overflow so we use floats here.
+        # Rotating and sorting is done in double precision and only result is DataTypes.XY
+        xy = np.fliplr(self.pscands_ij.astype(np.float64))[:, 0:2]
         xy[:, 0] *= 20
         xy[:, 1] *= 4
 
         xy = self.__scene_rotate(xy)
 
-        # Return value is array. Make it correct here
-        xy = ArrayUtils.matrix_to_array(xy)
-
         sort_ind = np.lexsort((xy[:, 0], xy[:, 1]))
         sorted_xy = xy[sort_ind]
 
         # TODO Multiply to closest millimeter. But why it is already int
         sorted_xy = np.around(sorted_xy * 1000) / 1000
 
-        return sorted_xy, sort_ind
+        return sorted_xy.astype(DataTypes.XY), sort_ind
 
-    def __scene_rotate(self, xy: np.matrix):
+    def __scene_rotate(self, xy: np.ndarray):
         # TODO find better name for this variable
         theta = (180 - self.heading) * math.pi / 180
         if theta > math.pi:
             theta -= 2 * math.pi
 
         rotm = np.array([[math.cos(theta), math.sin(theta)], [-math.sin(theta), math.cos(theta)]])
-        xy = xy.H
+        xy = xy.transpose()
 
-        rotated_xy = rotm * xy
+        rotated_xy = np.dot(rotm, xy)
         # We need maximum element, that's why we don't use axis parameter
         is_improved = np.amax(rotated_xy[0]) - np.amin(rotated_xy[0]) < np.amax(xy[0]) - np.amin(
             xy[0]) and np.amax(rotated_xy[1]) - np.amin(rotated_xy[1]) < np.amax(xy[1]) - np.amin(
@@ -368,23 +471,27 @@ class PsFiles(MetaSubProcess):
         if is_improved:
             xy = rotated_xy
 
-        xy = xy.H
-        return xy
+        return xy.transpose()
 
     def __sort_results(self, sort_ind: np.ndarray, sat_look_angle: np.ndarray):
-        self.ph = self.ph[sort_ind]
-        self.bperp = self.bperp[sort_ind]
+        if not self.out_of_core:
+            self.bperp = self.bperp[sort_ind]
         self.da = self.da[sort_ind]
 
-        self.pscands_ij = MatrixUtils.sort_matrix_with_sort_array(self.pscands_ij, sort_ind)
-        self.lonlat = MatrixUtils.sort_matrix_with_sort_array(self.lonlat, sort_ind)
+        self.pscands_ij = self.pscands_ij[sort_ind]
+        self.lonlat = self.lonlat[sort_ind]
 
-        self.sort_ind = sat_look_angle[sort_ind]
+        # Column array like in StaMPS
+        self.sort_ind = ArrayUtils.to_col_matrix(sat_look_angle[sort_ind])
         self.hgt = self.hgt[sort_ind]
 
     def __get_da(self):
-        # Because the file is small (only one column) then loadtxt function is quick enough
-        return np.loadtxt(str(Path(self.__patch_path, "pscands.1.da")))
+        # Because the file is small (only one column) then loadtxt function is quick enough.
+        # Still it is cached, so it is parsed only once
+        path = Path(self.__patch_path, "pscands.1.da")
+        loaded = self.__metadata_cache.get("pscands_da", [path],
+                                           lambda: {'da': np.loadtxt(str(path))})
+        return loaded['da'].astype(DataTypes.DA)
 
     def __get_look_angle(self, rg: np.ndarray, params):
         sar_to_earth_center_sq = math.pow(float(params['sar_to_earth_center']), 2)
@@ -401,9 +508,7 @@ class PsFiles(MetaSubProcess):
         with path_to_hgt.open("rb") as file:
             hgt_raw = np.fromfile(file, FLOAT_TYPE)
 
-        hgt = hgt_raw.conj().transpose()
-
-        return hgt
+        return hgt_raw.astype(DataTypes.HGT)
 
     def __get_rg(self, params: dict):
         ij_lat = self.pscands_ij[:, 2]
@@ -427,10 +532,21 @@ class PsFiles(MetaSubProcess):
         """For exporting variables that are used in PsEstGamma and PsSelect"""
 
         nr_ifgs = len(self.ifgs)
-        nr_ps = len(self.pscands_ij)
+        nr_ps = len(self.xy)
 
         return self.ph, self.bperp, nr_ifgs, nr_ps, self.xy, self.da
 
+    def iter_ph_blocks(self):
+        """Generator that returns (start, end, block) where block is ph[start:end] in memory. In
+        out-of-core mode blocks are read from store, so whole ph is never in memory at once"""
+        if self.out_of_core:
+            yield from self.__store.iter_blocks('ph')
+        else:
+            block_size = ChunkedArrayStore.DEFAULT_BLOCK_SIZE
+            for start in range(0, len(self.ph), block_size):
+                end = min(start + block_size, len(self.ph))
+                yield start, end, self.ph[start:end]
+
     def get_nr_ifgs_copared_to_master(self, comp_fun: Callable[[date, date], bool],
                                       ifgs=np.array([]), master_date: date=None):
         """
@@ -4,10 +4,13 @@ import numpy as np
 import os
 
 from scripts.MetaSubProcess import MetaSubProcess
+from scripts.funs.ClapFilt import ClapFilt
+from scripts.funs.FftBackend import FftBackend
 from scripts.funs.PsTopofit import PsTopofit
 from scripts.processes.PsEstGamma import PsEstGamma
 from scripts.processes.PsFiles import PsFiles
 from scripts.utils.ArrayUtils import ArrayUtils
+from scripts.utils.internal.DataTypes import DataTypes
 from scripts.utils.internal.LoggerFactory import LoggerFactory
 from scripts.utils.MatlabUtils import MatlabUtils
 from scripts.utils.internal.ProcessCache import ProcessCache
@@ -22,14 +25,28 @@ class PsSelect(MetaSubProcess):
 
     __FILE_NAME = "ps_select"
 
-    def __init__(self, ps_files: PsFiles, ps_est_gamma: PsEstGamma):
+    def __init__(self, ps_files: PsFiles, ps_est_gamma: PsEstGamma,
+                 precision=DataTypes.PRECISION_DOUBLE, topofit_engine=PsTopofit.ENGINE_NUMPY,
+                 topofit_search=PsTopofit.SEARCH_EXHAUSTIVE,
+                 fft_backend=FftBackend.BACKEND_NUMPY, fft_workers=1):
+        """precision = DataTypes.PRECISION_SINGLE or DataTypes.PRECISION_DOUBLE. With single
+        precision ph_patch, filtering and topofit are made with float32/ complex64 arrays
+        topofit_engine = PsTopofit.ENGINE_NUMPY or PsTopofit.ENGINE_NUMBA (see PsTopofit)
+        topofit_search = PsTopofit.SEARCH_EXHAUSTIVE or PsTopofit.SEARCH_COARSE_TO_FINE
+        fft_backend, fft_workers = FFT backend and its threads in CLAP filtering (see FftBackend)"""
         self.__PH_PATCH_CACHE = True
+        self.__precision = precision
+        self.__topofit_engine = PsTopofit.get_engine(topofit_engine)
+        self.__topofit_search = topofit_search
+        self.__complex_type = DataTypes.get_complex_type(precision)
         self.__ps_files = ps_files
         self.__ps_est_gamma = ps_est_gamma
 
         self.__logger = LoggerFactory.create("PsSelect")
 
         self.__set_internal_params()
+        self.__clap_filt = ClapFilt(self.__clap_alpha, self.__clap_beta, self.__clap_win,
+                                    precision, FftBackend(fft_backend, fft_workers))
 
     def __set_internal_params(self):
         """In StaMPS these where saved with setparam and getparam.
@@ -49,17 +66,17 @@ class PsSelect(MetaSubProcess):
         self.__drop_ifg_index = np.array([])
         self.__low_coh_tresh = 31  # 31/100
 
-        self.__gaussian_window = np.multiply(np.asmatrix(MatlabUtils.gausswin(7)),
-                                             np.asmatrix(MatlabUtils.gausswin(7)).conj().transpose())
-
     class __DataDTO(object):
         """This is inner data transfer object. It is because some functions take very many
         parameters, so we use this class. It is filled in load_ps_params function"""
 
         def __init__(self, ph: np.ndarray, nr_ifgs: int, xy: np.ndarray,
                      da: np.ndarray, ifg_ind: np.ndarray, da_max: np.ndarray,
-                     rand_dist: np.ndarray):
+                     rand_dist: np.ndarray, no_master_ix: np.ndarray):
+            # ph is with master interferogram (in out-of-core mode memmap). Use only rows that
+            # are needed and then no_master_ix columns
             self.ph = ph
+            self.no_master_ix = no_master_ix
             self.nr_ifgs = nr_ifgs
             self.xy = xy
             self.da = da
@@ -187,7 +204,8 @@ class PsSelect(MetaSubProcess):
             return da_max, da
 
         def filter_params_based_on_ifgs_and_master(ph: np.ndarray, bperp: np.ndarray, nr_ifgs: int):
-            """Filter out master row form ph and bperp arrays"""
+            """Filter out master row form bperp array. ph is not copied here, only its column
+            indexes without master are returned (no_master_ix)"""
 
             comp_fun = lambda x, y: x < y
 
@@ -199,24 +217,25 @@ class PsSelect(MetaSubProcess):
             master_ix = self.__ps_files.get_nr_ifgs_copared_to_master(comp_fun) - 1
             ifg_ind[ifg_ind > master_ix] -= 1
 
-            ph = ph[:, no_master_ix]
             bperp = bperp[no_master_ix]
             nr_ifgs = len(no_master_ix)
 
-            return ifg_ind, ph, bperp, nr_ifgs
+            return ifg_ind, no_master_ix, bperp, nr_ifgs
 
         ph, bperp, nr_ifgs, _, xy, da = self.__ps_files.get_ps_variables()
 
         # In StaMPS this is done when small_base_line flag is not 'y'. Beacause this process is
         # made as small_baseline_flag value is 'n' we also make this always
-        ifg_ind, ph, bperp, nr_ifgs = filter_params_based_on_ifgs_and_master(ph, bperp, nr_ifgs)
+        ifg_ind, no_master_ix, bperp, nr_ifgs = filter_params_based_on_ifgs_and_master(
+            ph, bperp, nr_ifgs)
 
         da_max, da = get_da_max(da)
 
         # nr_dist in StaMPS
         rand_dist = self.__ps_est_gamma.rand_dist
 
-        data_dto = self.__DataDTO(ph, nr_ifgs, xy, da, ifg_ind, da_max, rand_dist)
+        data_dto = self.__DataDTO(ph, nr_ifgs, xy, da, ifg_ind, da_max, rand_dist,
+                                  no_master_ix)
         return data_dto
 
     def __get_max_rand(self, da_max: np.ndarray, xy: np.ndarray):
@@ -418,9 +437,6 @@ class PsSelect(MetaSubProcess):
             nr_i = MatlabUtils.max(self.__ps_est_gamma.grid_ij[:, 0])
             nr_j = MatlabUtils.max(self.__ps_est_gamma.grid_ij[:, 1])
 
-            # In StaMPS this variable had '2' at the end of the name
-            ph_filt = np.zeros((self.__clap_win, self.__clap_win, data.nr_ifgs), np.complex128)
-
             for i in range(ph_patch.shape[0]):
                 ps_ij = self.__ps_est_gamma.grid_ij[coh_thresh_ind[i], :]
 
@@ -440,12 +456,13 @@ class PsSelect(MetaSubProcess):
                 ph_bit_ind_j = get_ph_bit_ind_array(ps_bit_j, ph_bit_len)
                 ph_bit[ph_bit_ind_i, ph_bit_ind_j, 0] = 0
 
-                # It is similar with PsEstGammas ph_flit process but still not the same
-                for j in range(ph_patch.shape[1]):
-                    ph_filt[:, :, j] = self.__clap_filt_for_patch(ph_bit[:, :, j],
-                                                                  self.__ps_est_gamma.low_pass)
+                # All interferograms at once. In StaMPS this variable had '2' at the end of
+                # the name
+                ph_filt = self.__clap_filt.filter_windows(
+                    np.moveaxis(ph_bit[:, :, :ph_patch.shape[1]], 2, 0),
+                    self.__ps_est_gamma.low_pass)
 
-                ph_patch[i, :] = np.squeeze(ph_filt[ps_bit_i, ps_bit_j, :])
+                ph_patch[i, :] = ph_filt[:, ps_bit_i, ps_bit_j]
 
             return ph_patch
 
@@ -453,7 +470,9 @@ class PsSelect(MetaSubProcess):
             try:
                 self.__logger.debug("Trying to use cache")
                 loaded = ProcessCache.get_from_cache(CACHE_FILE_NAME, 'ph_patch', 'coh_thresh_ind')
-                if np.array_equal(coh_thresh_ind, loaded['coh_thresh_ind']):
+                # Cache that is made with other precision is not used
+                if np.array_equal(coh_thresh_ind, loaded['coh_thresh_ind']) and \
+                        loaded['ph_patch'].dtype == self.__complex_type:
                     self.__logger.debug("Using cache")
                     ph_patch = loaded['ph_patch']
                 else:
@@ -474,47 +493,15 @@ class PsSelect(MetaSubProcess):
 
         return ph_patch
 
-    def __clap_filt_for_patch(self, ph, low_pass):
-        """Combined Low-pass Adaptive Phase filtering on 1 patch.
-        In StaMPS this is in separate function clap_filt_patch"""
-
-        alpha = self.__clap_alpha
-        beta = self.__clap_beta
-
-        if len(low_pass) == 0:
-            low_pass = np.zeros(len(ph))
-
-        ph = np.nan_to_num(ph)
-
-        # todo This ph_fft its very similar with PhEstGamma function clap_filt
-        # todo There where problems (incorrect value) with this part when calling third time
-        ph_fft = np.fft.fft2(ph)
-        smooth_resp = np.abs(ph_fft)
-        smooth_resp = np.fft.ifftshift(
-            MatlabUtils.filter2(self.__gaussian_window, np.fft.fftshift(smooth_resp)))
-        smooth_resp_mean = np.median(smooth_resp.flatten())
-
-        if smooth_resp_mean != 0:
-            smooth_resp /= smooth_resp_mean
-
-        smooth_resp = np.power(smooth_resp, alpha)
-
-        smooth_resp -= 1
-        smooth_resp[smooth_resp < 0] = 0
-
-        G = smooth_resp * beta + low_pass
-        ph_filt = np.fft.ifft2(np.multiply(ph_fft, G))
-
-        return ph_filt
-
     def __topofit(self, ph_patch, coh_thresh_ind, data) -> (np.ndarray, PsTopofit):
         NR_PS = len(coh_thresh_ind)
         SW_ARRAY_SHAPE = (NR_PS, 1)
 
-        ph = data.ph[coh_thresh_ind, :]
+        ph = data.ph[coh_thresh_ind][:, data.no_master_ix]
         bperp = self.__ps_files.bperp[coh_thresh_ind]
 
-        topofit = PsTopofit(SW_ARRAY_SHAPE, NR_PS, data.nr_ifgs)
+        topofit = PsTopofit(SW_ARRAY_SHAPE, NR_PS, data.nr_ifgs, self.__precision,
+                            self.__topofit_engine, self.__topofit_search)
         topofit.ps_topofit_loop(ph, ph_patch, bperp, self.__ps_est_gamma.nr_trial_wraps,
                                 data.ifg_ind)
 
@@ -547,4 +534,4 @@ class PsSelect(MetaSubProcess):
 
     # TODO: Why not the same as in PsEstGamma?
     def __zero_ph_array(self, nr_ps, nr_ifgs):
-        return np.zeros((nr_ps, nr_ifgs), np.complex128)
+        return np.zeros((nr_ps, nr_ifgs), self.__complex_type)
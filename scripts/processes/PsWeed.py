@@ -14,8 +14,10 @@ from scripts.processes.PsFiles import PsFiles
 from scripts.processes.PsSelect import PsSelect
 from scripts.utils.ArrayUtils import ArrayUtils
 from scripts.utils.internal.ConfigUtils import ConfigUtils
+from scripts.utils.internal.DataTypes import DataTypes
 from scripts.utils.internal.FolderConstants import FolderConstants
 from scripts.utils.internal.LoggerFactory import LoggerFactory
+from scripts.utils.internal.MetadataCache import MetadataCache
 from scripts.utils.MatlabUtils import MatlabUtils
 from scripts.utils.internal.ProcessDataSaver import ProcessDataSaver
 
@@ -30,7 +32,15 @@ class PsWeed(MetaSubProcess):
     selectable_ps = np.array([])
 
     def __init__(self, path_to_patch: str, ps_files: PsFiles, ps_est_gamma: PsEstGamma,
-                 ps_select: PsSelect):
+                 ps_select: PsSelect, patch_folder_name: str = FolderConstants.PATCH_FOLDER_NAME,
+                 precision=DataTypes.PRECISION_DOUBLE):
+        """patch_folder_name = PATCH folder in path_to_patch where psweed.2.edge file is
+        precision = DataTypes.PRECISION_SINGLE or DataTypes.PRECISION_DOUBLE. With single
+        precision phase differences between neighbours are float32/ complex64 arrays. Least
+        squares are always made in double precision"""
+        self.__float_type = DataTypes.get_float_type(precision)
+        self.__complex_type = DataTypes.get_complex_type(precision)
+
         self.__ps_files = ps_files
         self.__ps_select = ps_select
         self.__ps_est_gamma = ps_est_gamma
@@ -45,10 +55,11 @@ class PsWeed(MetaSubProcess):
         # todo drop_ifg_index on juba PsSelect'is
         self.__drop_ifg_index = np.array([])
 
-        self.__ps_weed_edge_data = self.__load_psweed_edge_file(path_to_patch)
+        self.__ps_weed_edge_data = self.__load_psweed_edge_file(path_to_patch, patch_folder_name)
         self.__logger.debug("self.__ps_weed_edge_data.len: " + str(len(self.__ps_weed_edge_data)))
 
-    def __load_psweed_edge_file(self, path: str) -> (int, np.ndarray):
+    def __load_psweed_edge_file(self, path: str,
+                                patch_folder_name: str) -> (int, np.ndarray):
         """We load this file here because our process may not reach in this step and this file's
         data is needed only here.
 
@@ -57,11 +68,14 @@ class PsWeed(MetaSubProcess):
         # todo Maybe use @lazy and put this to PsFiles class
 
         file_name = "psweed.2.edge"
-        psweed_path = Path(path, FolderConstants.PATCH_FOLDER_NAME, file_name)
+        psweed_path = Path(path, patch_folder_name, file_name)
         self.__logger.debug("Path to psweed edge file: " + str(psweed_path))
         if psweed_path.exists():
-            data = np.genfromtxt(psweed_path, skip_header=True, dtype=self.__IND_ARRAY_TYPE)
-            return data
+            metadata_cache = MetadataCache(FolderConstants.METADATA_CACHE_PATH)
+            loaded = metadata_cache.get("psweed_edge", [psweed_path], lambda: {
+                'edges': np.genfromtxt(psweed_path, skip_header=True,
+                                       dtype=self.__IND_ARRAY_TYPE)})
+            return loaded['edges']
         else:
             raise FileNotFoundError("File named '{1}' not found. AbsPath '{0}'".format(
                 str(psweed_path.absolute()), file_name))
@@ -69,8 +83,8 @@ class PsWeed(MetaSubProcess):
     class __DataDTO(object):
 
         def __init__(self, ind: np.ndarray, ph_res: np.ndarray, coh_thresh_ind: np.ndarray,
-                     k_ps: np.ndarray, c_ps: np.ndarray, coh_ps: np.ndarray, pscands_ij: np.matrix,
-                     xy: np.ndarray, lonlat: np.matrix, hgt: np.ndarray, ph: np.ndarray,
+                     k_ps: np.ndarray, c_ps: np.ndarray, coh_ps: np.ndarray, pscands_ij: np.ndarray,
+                     xy: np.ndarray, lonlat: np.ndarray, hgt: np.ndarray, ph: np.ndarray,
                      ph_patch_org: np.ndarray, bperp_meaned: np.ndarray, nr_ifgs: int,
                      nr_ps: int, master_date: datetime, master_nr: int, ifg_dates: []):
             self.ind = ind
@@ -270,8 +284,8 @@ class PsWeed(MetaSubProcess):
                               lonlat, hgt, ph, ph_patch_org, bperp_meaned, nr_ifgs, nr_ps,
                               master_date, master_nr, ifg_dates)
 
-    def __get_ij_shift(self, pscands_ij: np.matrix, coh_ps_len: int) -> np.ndarray:
-        ij = np.asarray(pscands_ij[:, 1:3])
+    def __get_ij_shift(self, pscands_ij: np.ndarray, coh_ps_len: int) -> np.ndarray:
+        ij = pscands_ij[:, 1:3]
         repmated = np.matlib.repmat(np.array([2, 2]) - ij.min(axis=0), coh_ps_len, 1)
         ij_shift = ij + repmated
 
@@ -385,6 +399,10 @@ class PsWeed(MetaSubProcess):
 
         def get_ph_weed(bperp: np.ndarray, k_ps: np.ndarray, ph: np.ndarray, c_ps: np.ndarray,
                         master_nr: int):
+            # In double precision these don't make copies
+            k_ps = k_ps.astype(self.__float_type, copy=False)
+            bperp = bperp.astype(self.__float_type, copy=False)
+
             exped = np.exp(-1j * (k_ps * bperp.conj().transpose()))
             ph_weed = np.multiply(ph, exped)
             ph_weed = np.divide(ph_weed, np.abs(ph_weed))
@@ -421,8 +439,8 @@ class PsWeed(MetaSubProcess):
         # This all is made when small_baseline_flag != 'y'
 
         dph_shape = (len(edges), len(ifg_ind))
-        dph_smooth = np.zeros(dph_shape).astype(np.complex128)
-        dph_smooth2 = np.zeros(dph_shape).astype(np.complex128)
+        dph_smooth = np.zeros(dph_shape, self.__complex_type)
+        dph_smooth2 = np.zeros(dph_shape, self.__complex_type)
         for i in range(len(ifg_ind)):
             time_delta = get_time_deltas_in_days(i)
             weight_factor = np.exp(-(np.power(time_delta, 2)) / 2 / math.pow(self.__time_win, 2))
@@ -438,8 +456,7 @@ class PsWeed(MetaSubProcess):
             weighted_least_sqrt = MatlabUtils.lscov(G, dph_mean_adj.conj().transpose(),
                                                     weight_factor)
             #todo Find better name
-            least_sqrt_G = np.asarray((np.asmatrix(G) * np.asmatrix(weighted_least_sqrt))
-                                      .conj().transpose())
+            least_sqrt_G = np.dot(G, weighted_least_sqrt).conj().transpose()
             dph_mean_adj = np.angle(np.exp(1j * (dph_mean_adj - least_sqrt_G)))
             # 'm2' in Stamps
             weighted_least_sqrt2 = MatlabUtils.lscov(G, dph_mean_adj.conj().transpose(),
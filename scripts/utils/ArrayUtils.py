@@ -23,8 +23,4 @@ class ArrayUtils:
         """Input array is transposed and made to column matrix.
         There isn't check if it is col - or row matrix."""
 
-        return array[np.newaxis].transpose()
-
-    @staticmethod
-    def matrix_to_array(matrix: np.matrix) -> np.ndarray:
-        return np.squeeze(np.asarray(matrix))
\ No newline at end of file
+        return array[np.newaxis].transpose()
\ No newline at end of file
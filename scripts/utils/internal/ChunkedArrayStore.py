@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import numpy as np
+
+from scripts.utils.internal.LoggerFactory import LoggerFactory
+
+
+class ChunkedArrayStore:
+    """On-disk store for arrays that may not fit into memory. Every array is .npy file in store
+    folder and it is opened with memory-map, so it can be written and read block by block (rows
+    block_size at the time)."""
+
+    DEFAULT_BLOCK_SIZE = 1 << 16
+
+    def __init__(self, store_path: str, block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        :param store_path: Folder where arrays are saved. Made when it does not exist
+        :param block_size: How many rows are in one block when iterating with iter_blocks
+        """
+        self.store_path = store_path
+        self.__store_path = Path(store_path)
+        self.block_size = block_size
+
+        self.__logger = LoggerFactory.create("ChunkedArrayStore")
+
+    def create(self, name: str, shape: tuple, dtype) -> np.memmap:
+        """Makes new array to store (old one is overwritten) and returns it as writable memmap"""
+
+        if not self.__store_path.exists():
+            self.__store_path.mkdir(parents=True)
+
+        self.__logger.debug("Creating '{0}' shape {1} to {2}".format(name, shape,
+                                                                     self.__store_path))
+        return np.lib.format.open_memmap(str(self.__get_file_path(name)), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    def open(self, name: str) -> np.memmap:
+        """Returns saved array as read only memmap"""
+
+        file_path = self.__get_file_path(name)
+        if not file_path.exists():
+            raise FileNotFoundError("No '{0}' in store. Abs.path '{1}'".format(
+                name, str(file_path.absolute())))
+
+        return np.load(str(file_path), mmap_mode='r')
+
+    def exists(self, name: str) -> bool:
+        return self.__get_file_path(name).exists()
+
+    def iter_blocks(self, name: str):
+        """Generator that returns (start, end, block) where block is array[start:end] in memory"""
+
+        array = self.open(name)
+        for start in range(0, len(array), self.block_size):
+            end = min(start + self.block_size, len(array))
+            yield start, end, np.array(array[start:end])
+
+    def __get_file_path(self, name: str) -> Path:
+        return Path(self.__store_path, name + ".npy")
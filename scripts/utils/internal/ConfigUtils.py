@@ -13,5 +13,10 @@ class ConfigUtils:
 
         self.config.read(PROPERTIES_FILE)
 
-    def get_default_section(self, key: str):
-        return self.config['DEFAULT'][key]
\ No newline at end of file
+    def get_default_section(self, key: str, fallback: str = None):
+        """When fallback is set then it is returned if there isn't key in properties file.
+        Otherwise missing key raises KeyError"""
+        if fallback is None:
+            return self.config['DEFAULT'][key]
+        else:
+            return self.config['DEFAULT'].get(key, fallback)
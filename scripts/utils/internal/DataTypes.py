@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class DataTypes:
+    """Array types of data that is passed from process to process. Those are same or a bit larger
+    than in StaMPS input files, so arrays are not bigger than needed. If more precision is needed
+    in calculations then array is converted locally."""
+
+    # pscands.1.ij. Candidate index, azimuth line and range sample
+    IJ = np.int32
+    # Longitude and latitude from geo file
+    LONLAT = np.float32
+    # Candidate coordinates in meters. Rounded to millimeters
+    XY = np.float32
+    # pscands.1.hgt
+    HGT = np.float32
+    # pscands.1.da. Amplitude dispersion
+    DA = np.float32
+    # pscands.1.ph. Complex interferogram phase
+    PH = np.complex64
+
+    # Possible values for 'precision' in configuration. With single precision processes use
+    # float32/ complex64 arrays in calculations. Least squares and sums are still made in double
+    # precision
+    PRECISION_SINGLE = "single"
+    PRECISION_DOUBLE = "double"
+
+    @staticmethod
+    def get_float_type(precision: str):
+        """Float type that is used in calculations with this precision"""
+        DataTypes.__check_precision(precision)
+        return np.float32 if precision == DataTypes.PRECISION_SINGLE else np.float64
+
+    @staticmethod
+    def get_complex_type(precision: str):
+        """Complex type that is used in calculations with this precision"""
+        DataTypes.__check_precision(precision)
+        return np.complex64 if precision == DataTypes.PRECISION_SINGLE else np.complex128
+
+    @staticmethod
+    def __check_precision(precision: str):
+        if precision not in (DataTypes.PRECISION_SINGLE, DataTypes.PRECISION_DOUBLE):
+            raise AttributeError("Unknown precision '{0}'. Use '{1}' or '{2}'".format(
+                precision, DataTypes.PRECISION_SINGLE, DataTypes.PRECISION_DOUBLE))
@@ -0,0 +1,94 @@
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+
+import numpy as np
+
+
+class DimapReader:
+    """Reads bands from BEAM-DIMAP product (.dim file) without SNAP. Product's .data folder
+    contains every band as ENVI raster (.img) with header (.hdr). Bands are opened with np.memmap
+    so only parts that are used are read from disk."""
+
+    # ENVI 'data type' codes. https://www.harrisgeospatial.com/docs/ENVIHeaderFiles.html
+    __ENVI_DATA_TYPES = {
+        1: 'u1',
+        2: 'i2',
+        3: 'i4',
+        4: 'f4',
+        5: 'f8',
+        6: 'c8',
+        9: 'c16',
+        12: 'u2',
+        13: 'u4',
+        14: 'i8',
+        15: 'u8'
+    }
+
+    def __init__(self, dim_file: str):
+        self.__dim_file = Path(dim_file)
+
+        if not self.__dim_file.exists():
+            raise FileNotFoundError("No .dim file. Abs.path '{0}'".format(
+                str(self.__dim_file.absolute())))
+
+        self.__band_headers = self.__load_band_headers()
+
+    def get_band(self, band_name: str) -> np.memmap:
+        """Returns band as read only np.memmap. Shape is (lines, samples)"""
+
+        if band_name not in self.__band_headers:
+            raise FileNotFoundError("No band '{0}' in '{1}'".format(band_name,
+                                                                    str(self.__dim_file)))
+
+        header_path = self.__band_headers[band_name]
+        header = self.__load_envi_header(header_path)
+
+        if int(header['bands']) != 1:
+            raise ValueError("Only single band ENVI files are supported. File '{0}'"
+                             .format(str(header_path)))
+
+        byte_order = '>' if int(header.get('byte order', 0)) == 1 else '<'
+        dtype = np.dtype(byte_order + self.__ENVI_DATA_TYPES[int(header['data type'])])
+
+        return np.memmap(str(header_path.with_suffix('.img')), dtype=dtype, mode='r',
+                         offset=int(header.get('header offset', 0)),
+                         shape=(int(header['lines']), int(header['samples'])))
+
+    def __load_band_headers(self) -> dict:
+        """Finds band names and their .hdr files from .dim file. In .dim file 'Data_File' elements
+        have path to header and 'Spectral_Band_Info' elements have band name. Those are connected
+        with BAND_INDEX"""
+
+        root = ElementTree.parse(str(self.__dim_file)).getroot()
+
+        header_paths = {}
+        for data_file in root.iter('Data_File'):
+            band_index = data_file.find('BAND_INDEX').text.strip()
+            href = data_file.find('DATA_FILE_PATH').get('href')
+            header_paths[band_index] = Path(self.__dim_file.parent, href)
+
+        band_headers = {}
+        for band_info in root.iter('Spectral_Band_Info'):
+            band_index = band_info.find('BAND_INDEX').text.strip()
+            if band_index in header_paths:
+                band_headers[band_info.find('BAND_NAME').text.strip()] = header_paths[band_index]
+
+        return band_headers
+
+    # noinspection PyMethodMayBeStatic
+    def __load_envi_header(self, header_path: Path) -> dict:
+        """ENVI header is 'key = value' per line. Values in curly brackets may span over many
+        lines, but those we don't need so we don't merge them."""
+
+        if not header_path.exists():
+            raise FileNotFoundError("No ENVI header. Abs.path '{0}'".format(
+                str(header_path.absolute())))
+
+        header = {}
+        with header_path.open() as header_file:
+            for line in header_file:
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    header[key.strip().lower()] = value.strip()
+
+        return header
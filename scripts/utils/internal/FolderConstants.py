@@ -9,4 +9,7 @@ class FolderConstants:
 
     __SAVE_PATH = ConfigUtils(RESOURCES_PATH).get_default_section('save_load_path')
 
-    CACHE_PATH = os.path.join(__SAVE_PATH, "tmp")
\ No newline at end of file
+    CACHE_PATH = os.path.join(__SAVE_PATH, "tmp")
+
+    # MetadataCache files (parsed text files)
+    METADATA_CACHE_PATH = os.path.join(CACHE_PATH, "metadata")
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from scripts.utils.internal.LoggerFactory import LoggerFactory
+
+
+class MetadataCache:
+    """Cache for values parsed from small text files (rsc, .base, pscphase.in etc.).
+
+    Parsed values are saved to .npz file. Cache file is found by source file paths and it is
+    valid while source files have same size and modification time. When source files change then
+    values are parsed again and cache file is overwritten."""
+
+    __KEY_NAME = "cache_key"
+
+    def __init__(self, cache_path: str):
+        self.__cache_path = Path(cache_path)
+
+        self.__logger = LoggerFactory.create("MetadataCache")
+
+    def get(self, name: str, source_paths: list, loader: Callable[[], dict]) -> dict:
+        """Returns values that loader returns. Loader is called only when there is no valid cache.
+
+        :param name: Name of the cached values. Used in cache file name
+        :param source_paths: Files that loader parses
+        :param loader: Function that parses source files and returns dict. Values must be
+            something that np.savez can save without pickle (numbers, strings, arrays)
+        :return: dict where arrays are as they were. Single values (like strings or numbers) are
+            converted to Python types
+        """
+
+        source_paths = [Path(source_path).absolute() for source_path in source_paths]
+
+        # When some file is missing then loader gives error that is more informative
+        if not all(source_path.exists() for source_path in source_paths):
+            return loader()
+
+        cache_key = self.__get_cache_key(source_paths)
+        cache_file = self.__get_cache_file(name, source_paths)
+
+        cached = self.__load(cache_file, cache_key)
+        if cached is not None:
+            self.__logger.debug("Using cache '{0}'".format(cache_file))
+            return cached
+
+        values = loader()
+        self.__save(cache_file, cache_key, values)
+
+        return values
+
+    def __load(self, cache_file: Path, cache_key: str):
+        if not cache_file.exists():
+            return None
+
+        try:
+            with np.load(str(cache_file)) as loaded:
+                if str(loaded[self.__KEY_NAME]) != cache_key:
+                    return None
+
+                return {key: self.__from_saved(loaded[key]) for key in loaded.files
+                        if key != self.__KEY_NAME}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self.__logger.info("Broken cache file '{0}'".format(cache_file))
+            return None
+
+    def __save(self, cache_file: Path, cache_key: str, values: dict):
+        if not self.__cache_path.exists():
+            self.__cache_path.mkdir(parents=True, exist_ok=True)
+
+        # Saved to temporary file first so other processes never read half written file
+        tmp_file = cache_file.with_name("{0}.{1}.tmp".format(cache_file.name, os.getpid()))
+        with tmp_file.open('wb') as file:
+            np.savez(file, **{self.__KEY_NAME: cache_key}, **values)
+        os.replace(str(tmp_file), str(cache_file))
+
+        self.__logger.debug("Saved cache '{0}'".format(cache_file))
+
+    def __get_cache_file(self, name: str, source_paths: list) -> Path:
+        paths_digest = hashlib.sha1(
+            "\n".join(str(source_path) for source_path in source_paths).encode()).hexdigest()
+        return Path(self.__cache_path, "{0}_{1}.npz".format(name, paths_digest))
+
+    # noinspection PyMethodMayBeStatic
+    def __get_cache_key(self, source_paths: list) -> str:
+        """Key is made from file paths, sizes and modification times"""
+        key_parts = []
+        for source_path in source_paths:
+            stat = source_path.stat()
+            key_parts.append("{0}:{1}:{2}".format(source_path, stat.st_size, stat.st_mtime_ns))
+
+        return "\n".join(key_parts)
+
+    # noinspection PyMethodMayBeStatic
+    def __from_saved(self, value: np.ndarray):
+        if value.ndim == 0:
+            return value.item()
+        else:
+            return value
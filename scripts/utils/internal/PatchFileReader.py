@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import numpy as np
+
+from scripts.utils.internal.DataTypes import DataTypes
+
+
+class PatchFileReader:
+    """Functions for reading files from PATCH folder that more than one process needs"""
+
+    # How many candidates are byte-swapped and copied at once when loading pscands.1.ph
+    __PH_BLOCK_SIZE = 1 << 20
+
+    @staticmethod
+    def load_pscands_ij(patch_path: Path) -> np.ndarray:
+        """Loads pscands.1.ij file. In every row there is candidate index, y (azimuth line) and
+        x (range sample). Whole file is parsed with one np.fromfile call and result is (n, 3)
+        array."""
+
+        path_to_pscands = Path(patch_path, "pscands.1.ij")
+        if not path_to_pscands.exists():
+            raise FileNotFoundError("Path {0}".format(path_to_pscands))
+
+        pscands_ij = np.fromfile(str(path_to_pscands), dtype=DataTypes.IJ,
+                                 sep=' ')
+
+        if pscands_ij.size % 3 != 0:
+            raise ValueError("pscands.1.ij rows are not with three columns. Path {0}".format(
+                path_to_pscands))
+
+        return pscands_ij.reshape((-1, 3))
+
+    @staticmethod
+    def load_ph(patch_path: Path, nr_ifgs: int, master_nr: int,
+                sort_ind: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+        """Loads pscands.1.ph file. In this file there are big-endian complex numbers, one row for
+        every interferogram.
+
+        File is memory-mapped as (nr_ifgs, nr_ps) view and copied block by block into one
+        preallocated (nr_ps, nr_ifgs) native complex64 array. So there is only one copy of ph in
+        memory. Master interferogram column is filled with ones.
+
+        :param patch_path: PATCH folder path
+        :param nr_ifgs: Number of interferograms (rows in file)
+        :param master_nr: Master interferogram number (starts from one)
+        :param sort_ind: When set then candidates are sorted with it while copying
+        :param out: Array where result is written (for example memmap from ChunkedArrayStore).
+            When None then new array is made
+        :return: (nr_ps, nr_ifgs) complex64 array
+        """
+
+        BINARY_COMPLEX_TYPE = np.dtype('>c8')  # "big-endian" 64bit complex
+
+        path_to_ph = Path(patch_path, "pscands.1.ph")
+        if not path_to_ph.exists():
+            raise FileNotFoundError("Path {0}".format(path_to_ph))
+
+        ph_raw = np.memmap(str(path_to_ph), dtype=BINARY_COMPLEX_TYPE, mode='r')
+        nr_ps = int(len(ph_raw) / nr_ifgs)
+        ph_raw = ph_raw[:nr_ps * nr_ifgs].reshape((nr_ifgs, nr_ps))
+
+        if out is None:
+            out = np.empty((nr_ps, nr_ifgs), DataTypes.PH)
+
+        for start in range(0, nr_ps, PatchFileReader.__PH_BLOCK_SIZE):
+            end = min(start + PatchFileReader.__PH_BLOCK_SIZE, nr_ps)
+            for ifg in range(nr_ifgs):
+                if ifg == master_nr - 1:
+                    out[start:end, ifg] = 1
+                elif sort_ind is None:
+                    out[start:end, ifg] = ph_raw[ifg, start:end]
+                else:
+                    out[start:end, ifg] = ph_raw[ifg, sort_ind[start:end]]
+
+        del ph_raw
+
+        return out
@@ -23,4 +23,9 @@ class ProcessCache:
 
     @staticmethod
     def save_to_cache(file_name: str, **cachable):
-        ProcessDataSaver(FolderConstants.CACHE_PATH, file_name).save_data(**cachable)
+        # Patches may be processed in parallel. File is saved with temporary name first so that
+        # other process never loads half written file
+        tmp_file_name = "{0}.{1}.tmp".format(file_name, os.getpid())
+        ProcessDataSaver(FolderConstants.CACHE_PATH, tmp_file_name).save_data(**cachable)
+        os.replace(os.path.join(FolderConstants.CACHE_PATH, tmp_file_name + ".npz"),
+                   os.path.join(FolderConstants.CACHE_PATH, file_name + ".npz"))
@@ -3,23 +3,65 @@ import numpy as np
 from typing import Type
 
 from scripts.MetaSubProcess import MetaSubProcess
+from scripts.funs.FftBackend import FftBackend
+from scripts.funs.PsTopofit import PsTopofit
 from scripts.processes.CreateLonLat import CreateLonLat
 from scripts.processes.PhaseCorrection import PhaseCorrection
 from scripts.processes.PsEstGamma import PsEstGamma
 from scripts.processes.PsFiles import PsFiles
 from scripts.processes.PsSelect import PsSelect
 from scripts.processes.PsWeed import PsWeed
+from scripts.utils.internal.DataTypes import DataTypes
+from scripts.utils.internal.FolderConstants import FolderConstants
 
 
 class ProcessHandler:
-    process_obj_dict = {}
     lonlat = np.array([])
 
-    def __init__(self, path: str, geo_file_path: str, save_load_path: str, rand_dist_cached: bool):
+    def __init__(self, path: str, geo_file_path: str, save_load_path: str, rand_dist_cached: bool,
+                 geo_reader: str = None, ps_files_out_of_core=False,
+                 patch_folder_name: str = FolderConstants.PATCH_FOLDER_NAME,
+                 precision: str = DataTypes.PRECISION_DOUBLE,
+                 topofit_engine: str = PsTopofit.ENGINE_NUMPY,
+                 rand_dist_size: int = PsEstGamma.DEFAULT_RAND_DIST_SIZE,
+                 rand_dist_tolerance: float = None,
+                 topofit_search: str = PsTopofit.SEARCH_EXHAUSTIVE,
+                 topofit_refit_threshold: float = None,
+                 fft_backend: str = FftBackend.BACKEND_NUMPY, fft_workers: int = 1,
+                 clap_workers: int = 1):
+        """patch_folder_name = PATCH folder in path that is processed. For every patch there is
+        separate ProcessHandler
+        precision = calculation precision in PsEstGamma, PsSelect and PsWeed ('single' or
+        'double')
+        topofit_engine = topofit engine in PsEstGamma and PsSelect ('numpy' or 'numba')
+        rand_dist_size, rand_dist_tolerance = random distribution size in PsEstGamma
+        topofit_search = trial search in PsEstGamma and PsSelect topofit ('exhaustive' or
+        'coarse_to_fine')
+        topofit_refit_threshold = ph_patch change (radians) after what pixel topofit is found again
+        in PsEstGamma gamma loop. When None then all pixels are found every iteration
+        fft_backend, fft_workers = FFT backend in PsEstGamma and PsSelect CLAP filtering ('numpy',
+        'scipy', 'pyfftw' or 'fastest') and its threads
+        clap_workers = threads that filter interferograms in PsEstGamma"""
+
+        # Every handler has its own processes. Otherwise patches would use each others results
+        self.process_obj_dict = {}
+
         self.__path = path
         self.__geo_file_path = geo_file_path
         self.__save_load_path = save_load_path
         self.__rand_dist_cached = rand_dist_cached
+        self.__geo_reader = geo_reader
+        self.__ps_files_out_of_core = ps_files_out_of_core
+        self.__patch_folder_name = patch_folder_name
+        self.__precision = precision
+        self.__topofit_engine = topofit_engine
+        self.__rand_dist_size = rand_dist_size
+        self.__rand_dist_tolerance = rand_dist_tolerance
+        self.__topofit_search = topofit_search
+        self.__topofit_refit_threshold = topofit_refit_threshold
+        self.__fft_backend = fft_backend
+        self.__fft_workers = fft_workers
+        self.__clap_workers = clap_workers
 
     def load_results(self, process: Type[MetaSubProcess]):
         process_obj = self.__init_process(process)
@@ -68,15 +110,28 @@ class ProcessHandler:
 
     def __init_process(self, process: Type[MetaSubProcess]) -> MetaSubProcess:
         if process is CreateLonLat:
-            return process(self.__path, self.__geo_file_path)
+            return process(self.__path, self.__geo_file_path, self.__geo_reader,
+                           self.__patch_folder_name)
         elif process is PsFiles:
-            return process(self.__path, self.process_obj_dict['LonLat'])
+            return process(self.__path, self.process_obj_dict['LonLat'],
+                           self.__ps_files_out_of_core, self.__save_load_path,
+                           self.__patch_folder_name)
         elif process is PsEstGamma:
-            return process(self.process_obj_dict['PsFiles'], self.__rand_dist_cached)
+            return process(self.process_obj_dict['PsFiles'], self.__rand_dist_cached,
+                           precision=self.__precision, topofit_engine=self.__topofit_engine,
+                           rand_dist_size=self.__rand_dist_size,
+                           rand_dist_tolerance=self.__rand_dist_tolerance,
+                           topofit_search=self.__topofit_search,
+                           topofit_refit_threshold=self.__topofit_refit_threshold,
+                           fft_backend=self.__fft_backend, fft_workers=self.__fft_workers,
+                           clap_workers=self.__clap_workers)
         elif process is PsSelect:
-            return process(self.process_obj_dict['PsFiles'], self.process_obj_dict['PsEstGamma'])
+            return process(self.process_obj_dict['PsFiles'], self.process_obj_dict['PsEstGamma'],
+                           self.__precision, self.__topofit_engine, self.__topofit_search,
+                           self.__fft_backend, self.__fft_workers)
         elif process is PsWeed:
             return process(self.__path, self.process_obj_dict['PsFiles'],
-                           self.process_obj_dict['PsEstGamma'], self.process_obj_dict['PsSelect'])
+                           self.process_obj_dict['PsEstGamma'], self.process_obj_dict['PsSelect'],
+                           self.__patch_folder_name, self.__precision)
         elif process is PhaseCorrection:
             return process(self.process_obj_dict['PsFiles'], self.process_obj_dict['PsWeed'])
\ No newline at end of file
@@ -0,0 +1,198 @@
+import threading
+from unittest import TestCase, mock, skipUnless
+
+import numpy as np
+
+from scripts.funs import FftBackend as FftBackendModule
+from scripts.funs.ClapFilt import ClapFilt
+from scripts.funs.FftBackend import FftBackend
+from scripts.utils.ArrayUtils import ArrayUtils
+from scripts.utils.MatlabUtils import MatlabUtils
+
+
+class TestClapFilt(TestCase):
+    CLAP_ALPHA = 1
+    CLAP_BETA = 0.3
+    CLAP_WIN = 32
+
+    def setUp(self):
+        self.__clap_filt = ClapFilt(self.CLAP_ALPHA, self.CLAP_BETA, self.CLAP_WIN)
+        self.__low_pass = ClapFilt.get_low_pass(self.CLAP_WIN, 50, 800)
+
+        random = np.random.RandomState(0)
+        self.__windows = random.randn(3, 32, 32) + 1j * random.randn(3, 32, 32)
+        self.__windows[0, :10, :10] = 0
+
+    def test_filter_windows(self):
+        actual = self.__clap_filt.filter_windows(self.__windows, self.__low_pass)
+
+        for i, window in enumerate(self.__windows):
+            np.testing.assert_allclose(actual[i], self.__filter_window(window, self.__low_pass),
+                                       atol=1e-12)
+
+    def test_filter_windows_without_low_pass(self):
+        actual = self.__clap_filt.filter_windows(self.__windows[0], np.array([]))
+
+        np.testing.assert_allclose(actual, self.__filter_window(self.__windows[0], 0), atol=1e-12)
+
+    def test_get_low_pass(self):
+        low_pass = ClapFilt.get_low_pass(self.CLAP_WIN, 50, 800)
+
+        self.assertIs(self.__low_pass, low_pass)
+        self.assertEqual((self.CLAP_WIN, self.CLAP_WIN), low_pass.shape)
+        self.assertFalse(low_pass.flags.writeable)
+
+    def test_filter_grid(self):
+        random = np.random.RandomState(1)
+        ph = random.randn(40, 35, 2) + 1j * random.randn(40, 35, 2)
+
+        actual = self.__clap_filt.filter_grid(ph, self.__low_pass)
+
+        self.assertEqual(ph.shape, actual.shape)
+        # Every interferogram is filtered separately
+        np.testing.assert_array_equal(
+            actual[:, :, 1:], self.__clap_filt.filter_grid(ph[:, :, 1:], self.__low_pass))
+
+    def test_filter_grid_workers(self):
+        random = np.random.RandomState(2)
+        ph = random.randn(40, 35, 7) + 1j * random.randn(40, 35, 7)
+
+        clap_filt_workers = ClapFilt(self.CLAP_ALPHA, self.CLAP_BETA, self.CLAP_WIN, workers=3)
+
+        np.testing.assert_array_equal(self.__clap_filt.filter_grid(ph, self.__low_pass),
+                                      clap_filt_workers.filter_grid(ph, self.__low_pass))
+
+    def test_filter_grid_workers_reuse_threads(self):
+        """Same threads are used in every filter_grid call, so their FftBackend plans are
+        reused"""
+        WORKERS = 3
+        ph = np.ones((40, 35, 7), np.complex128)
+
+        fft_backend = FftBackend()
+        fft2 = fft_backend.fft2
+        fft_threads = set()
+
+        def fft2_in_thread(a, axes):
+            fft_threads.add(threading.current_thread())
+            return fft2(a, axes)
+
+        fft_backend.fft2 = fft2_in_thread
+        clap_filt_workers = ClapFilt(self.CLAP_ALPHA, self.CLAP_BETA, self.CLAP_WIN,
+                                     fft_backend=fft_backend, workers=WORKERS)
+
+        for _ in range(3):
+            clap_filt_workers.filter_grid(ph, self.__low_pass)
+
+        self.assertNotIn(threading.current_thread(), fft_threads)
+        self.assertLessEqual(len(fft_threads), WORKERS)
+
+        clap_filt_workers.close()
+        self.assertFalse(any(fft_thread.is_alive() for fft_thread in fft_threads))
+
+    @skipUnless(FftBackendModule.pyfftw, "pyFFTW is not installed")
+    def test_filter_grid_workers_reuse_pyfftw_plans(self):
+        WORKERS = 3
+        ph = np.ones((40, 35, 7), np.complex128)
+
+        clap_filt_workers = ClapFilt(self.CLAP_ALPHA, self.CLAP_BETA, self.CLAP_WIN,
+                                     fft_backend=FftBackend(FftBackend.BACKEND_PYFFTW),
+                                     workers=WORKERS)
+
+        builders = FftBackendModule.pyfftw.builders
+        with mock.patch.object(builders, 'fft2', wraps=builders.fft2) as fft2_builder:
+            clap_filt_workers.filter_grid(ph, self.__low_pass)
+            nr_plans = fft2_builder.call_count
+
+            clap_filt_workers.filter_grid(ph, self.__low_pass)
+            clap_filt_workers.filter_grid(ph, self.__low_pass)
+
+            self.assertEqual(fft2_builder.call_count, nr_plans)
+        self.assertLessEqual(nr_plans, 2 * WORKERS)
+
+    def test_filter_grid_same_as_clap_filt_loop(self):
+        """filter_grid is compared to window by window loop that was in PsEstGamma before. Grid
+        sizes are not multiples of window step"""
+        random = np.random.RandomState(3)
+        for grid_shape in [(30, 27), (25, 90)]:
+            ph = random.randn(*grid_shape, 3) + 1j * random.randn(*grid_shape, 3)
+            ph[2, 5, 0] = np.nan
+            ph[grid_shape[0] - 1, :, 1] = np.nan
+
+            actual = self.__clap_filt.filter_grid(ph, self.__low_pass)
+
+            self.assertFalse(np.any(np.isnan(actual)))
+            for ifg in range(ph.shape[2]):
+                np.testing.assert_allclose(actual[:, :, ifg],
+                                           self.__clap_filt_loop(ph[:, :, ifg], self.__low_pass),
+                                           atol=1e-12)
+
+    def __clap_filt_loop(self, ph: np.ndarray, low_pass: np.ndarray) -> np.ndarray:
+        """Window by window CLAP filtering of one interferogram grid like in PsEstGamma before
+        ClapFilt"""
+        def get_indexes(loop_index: int, inc: int, nr_win: int) -> (int, int):
+            i1 = loop_index * inc
+            i2 = i1 + nr_win
+
+            return i1, i2
+
+        filtered = np.zeros(ph.shape, np.complex128)
+
+        ph = np.nan_to_num(ph)
+
+        nr_win = int(self.CLAP_WIN * 0.75)
+        nr_pad = int(self.CLAP_WIN * 0.25)
+
+        ph_i_len = ph.shape[0] - 1
+        ph_j_len = ph.shape[1] - 1
+        nr_inc = int(np.floor(nr_win / 4))
+        nr_win_i = int(np.ceil(ph_i_len / nr_inc) - 3)
+        nr_win_j = int(np.ceil(ph_j_len / nr_inc) - 3) + 1
+
+        grid_array = ArrayUtils.arange_include_last(0, (nr_win / 2) - 1)
+        grid_x, grid_y = np.meshgrid(grid_array, grid_array)
+        grid = grid_x + grid_y
+        wind_func = np.append(grid, np.fliplr(grid), axis=1)
+        wind_func = np.append(wind_func, np.flipud(wind_func), axis=0) + 1e-6
+
+        nr_win_pad_sum = (nr_win + nr_pad)
+        ph_bit = np.zeros((nr_win_pad_sum, nr_win_pad_sum), np.complex128)
+        for i in range(nr_win_i):
+            w_f = wind_func.copy()
+            i1, i2 = get_indexes(i, nr_inc, nr_win)
+
+            if i2 > ph_i_len:
+                i_shift = i2 - ph_i_len - 1
+                i2 = ph_i_len + 1
+                i1 = ph_i_len - nr_win + 1
+                w_f = np.append(np.zeros((i_shift, nr_win)), w_f[:nr_win - i_shift, :], axis=0)
+
+            for j in range(nr_win_j):
+                w_f2 = w_f
+                j1, j2 = get_indexes(j, nr_inc, nr_win)
+
+                if j2 > ph_j_len:
+                    j_shift = j2 - ph_j_len - 1
+                    j2 = ph_j_len + 1
+                    j1 = ph_j_len - nr_win + 1
+                    w_f2 = np.append(np.zeros((nr_win, j_shift)), w_f2[:, :nr_win - j_shift],
+                                     axis=1)
+
+                ph_bit[:nr_win, :nr_win] = ph[i1: i2, j1: j2]
+
+                ph_filt = self.__filter_window(ph_bit, low_pass)
+                filtered[i1:i2, j1:j2] += np.multiply(ph_filt[:nr_win, :nr_win], w_f2)
+
+        return filtered
+
+    def __filter_window(self, window: np.ndarray, low_pass):
+        """CLAP on one window like StaMPS clap_filt_patch"""
+        gaussian_window = np.outer(MatlabUtils.gausswin(7), MatlabUtils.gausswin(7))
+
+        ph_fft = np.fft.fft2(window)
+        smooth_resp = np.fft.ifftshift(
+            MatlabUtils.filter2(gaussian_window, np.fft.fftshift(np.abs(ph_fft))))
+        smooth_resp /= np.median(smooth_resp)
+        smooth_resp = np.power(smooth_resp, self.CLAP_ALPHA) - 1
+        smooth_resp[smooth_resp < 0] = 0
+
+        return np.fft.ifft2(ph_fft * (smooth_resp * self.CLAP_BETA + low_pass))
@@ -0,0 +1,51 @@
+from unittest import TestCase, mock
+
+import numpy as np
+
+from scripts.funs import FftBackend as FftBackendModule
+from scripts.funs.FftBackend import FftBackend
+
+
+class TestFftBackend(TestCase):
+    def test_fft2_and_ifft2_same_as_numpy(self):
+        random = np.random.RandomState(0)
+        windows = random.randn(3, 4, 32, 32) + 1j * random.randn(3, 4, 32, 32)
+
+        expected_fft = np.fft.fft2(windows)
+        expected_ifft = np.fft.ifft2(windows)
+
+        for backend in FftBackend.get_backends():
+            fft_backend = FftBackend(backend, 2)
+
+            # Twice, because pyFFTW plans are reused
+            for _ in range(2):
+                np.testing.assert_allclose(fft_backend.fft2(windows), expected_fft, atol=1e-10)
+                np.testing.assert_allclose(fft_backend.ifft2(windows), expected_ifft, atol=1e-10)
+
+            np.testing.assert_allclose(fft_backend.fft2(windows[0, 0], (0, 1)),
+                                       expected_fft[0, 0], atol=1e-10)
+
+    def test_get_backend(self):
+        expected_pyfftw_backend = FftBackend.BACKEND_PYFFTW if FftBackendModule.pyfftw \
+            else FftBackend.BACKEND_NUMPY
+
+        self.assertEqual(FftBackend.BACKEND_SCIPY, FftBackend.get_backend(FftBackend.BACKEND_SCIPY))
+        self.assertEqual(expected_pyfftw_backend,
+                         FftBackend.get_backend(FftBackend.BACKEND_PYFFTW))
+        self.assertRaises(AttributeError, FftBackend.get_backend, "mkl")
+
+    def test_fastest_backend(self):
+        fft_backend = FftBackend(FftBackend.BACKEND_FASTEST)
+
+        self.assertIn(fft_backend.backend, FftBackend.get_backends())
+
+    def test_fastest_backend_benchmark_once(self):
+        # Workers that other tests don't use, so there is no result from them
+        WORKERS = 5
+
+        with mock.patch.object(FftBackend, 'benchmark', wraps=FftBackend.benchmark) as benchmark:
+            first_backend = FftBackend(FftBackend.BACKEND_FASTEST, WORKERS)
+            second_backend = FftBackend(FftBackend.BACKEND_FASTEST, WORKERS)
+
+            self.assertEqual(benchmark.call_count, 1)
+        self.assertEqual(first_backend.backend, second_backend.backend)
@@ -1,8 +1,10 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless, mock
 
 import numpy as np
 
+from scripts.funs import PsTopofitKernel
 from scripts.funs.PsTopofit import PsTopofit
+from scripts.utils.internal.DataTypes import DataTypes
 
 
 class TestPsTopofit(TestCase):
@@ -33,3 +35,214 @@ class TestPsTopofit(TestCase):
                                              np.squeeze(actual_phase_residual))
         np.testing.assert_array_almost_equal(expected_static_offset, actual_static_offset)
         np.testing.assert_array_almost_equal(expected_k_0, actual_k_0[0])
+
+    def test_ps_topofit_fun_zero_weights(self):
+        """When all weights are zeros then slope correction is zero like lstsq minimum norm
+        solution"""
+        bperp_meaned = np.array([-40.0, -10.0, 0.0, 20.0, 60.0])
+        nr_trial_wraps = 0.0413031180032
+
+        with np.errstate(invalid='ignore'):
+            _, _, _, actual_k_0 = PsTopofit.ps_topofit_fun(np.zeros(5, np.complex128),
+                                                           bperp_meaned, nr_trial_wraps)
+
+        # First trial (-1) is chosen, because all trial coherences are same
+        np.testing.assert_array_almost_equal(-np.pi / 4 / 100, actual_k_0[0])
+
+    def test_ps_topofit_loop_same_as_ps_topofit_fun(self):
+        random = np.random.RandomState(3)
+        nr_ps, nr_ifgs = 50, 12
+        bperp = random.uniform(-150, 150, (nr_ps, nr_ifgs))
+        ph = np.exp(1j * random.normal(0, 1, (nr_ps, nr_ifgs)))
+        ph_patch = np.exp(1j * random.normal(0, 0.3, (nr_ps, nr_ifgs)))
+        ph[4, 2] = 0
+        ph[7, 5] = np.nan
+
+        topofit = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit.ps_topofit_loop(ph, ph_patch, bperp, 0.5)
+
+        for i in range(nr_ps):
+            if i in (4, 7):
+                self.assertTrue(np.isnan(topofit.k_ps[i, 0]))
+                self.assertEqual(topofit.coh_ps[i, 0], 0)
+                self.assertEqual(topofit.n_opt[i, 0], 0)
+                continue
+
+            phase_residual, coherence_0, static_offset, k_0 = PsTopofit.ps_topofit_fun(
+                ph[i] * ph_patch[i].conj(), bperp[i], 0.5)
+
+            self.assertEqual(topofit.k_ps[i, 0], k_0[0])
+            self.assertEqual(topofit.c_ps[i, 0], static_offset[0])
+            self.assertEqual(topofit.coh_ps[i, 0], coherence_0[0])
+            self.assertEqual(topofit.n_opt[i, 0], 1)
+            np.testing.assert_array_equal(topofit.ph_res[i], np.angle(phase_residual[:, 0]))
+
+    def test_ps_topofit_loop_shared_bperp(self):
+        random = np.random.RandomState(4)
+        nr_ps, nr_ifgs = 40, 15
+        bperp = random.uniform(-150, 150, nr_ifgs)
+        ph = np.exp(1j * random.normal(0, 1, (nr_ps, nr_ifgs)))
+        ph_patch = np.ones((nr_ps, nr_ifgs), np.complex128)
+        ifg_ind = np.arange(1, nr_ifgs)
+
+        topofit_shared = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit_shared.ps_topofit_loop(ph, ph_patch, bperp, 0.5, ifg_ind)
+        topofit_tiled = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit_tiled.ps_topofit_loop(ph, ph_patch, np.tile(bperp, (nr_ps, 1)), 0.5, ifg_ind)
+
+        np.testing.assert_array_equal(topofit_shared.n_opt, topofit_tiled.n_opt)
+        np.testing.assert_allclose(topofit_shared.k_ps, topofit_tiled.k_ps, atol=1e-12)
+        np.testing.assert_allclose(topofit_shared.coh_ps, topofit_tiled.coh_ps, atol=1e-12)
+        np.testing.assert_allclose(topofit_shared.ph_res, topofit_tiled.ph_res, atol=1e-10)
+
+    def test_get_shared_bperp_coherence(self):
+        random = np.random.RandomState(2005)
+        nr_ps, nr_ifgs = 100, 10
+        bperp_meaned = random.uniform(-150, 150, nr_ifgs)
+        phase = np.exp(1j * 2 * np.pi * random.rand(nr_ps, nr_ifgs))
+
+        get_coherence = PsTopofit.get_shared_bperp_coherence(bperp_meaned, 0.05)
+        actual_coherence = get_coherence(phase)
+
+        expected_coherence = [PsTopofit.ps_topofit_fun(phase[i], bperp_meaned, 0.05)[1][0]
+                              for i in range(nr_ps)]
+        np.testing.assert_allclose(actual_coherence, expected_coherence, atol=1e-12)
+
+    def test_ps_topofit_loop_coarse_to_fine_search(self):
+        """Coarse to fine search gives same results than exhaustive search. With this synthetic
+        data (161 trials) it finds about 50 trials per pixel. Exhaustive search uses non-uniform
+        FFT with that many trials, so both fast searches are compared here"""
+
+        random = np.random.RandomState(7)
+        nr_ps, nr_ifgs, nr_trial_wraps = 400, 40, 10
+        bperp = random.uniform(-300, 300, (nr_ps, nr_ifgs))
+        k_ps = random.uniform(-1, 1, (nr_ps, 1)) * nr_trial_wraps * 2 * np.pi / np.ptp(
+            bperp, axis=1, keepdims=True)
+        noise = np.where(random.rand(nr_ps, 1) < 0.5, 0.4, 3.0)
+        ph = np.exp(1j * (k_ps * bperp + random.normal(0, 1, (nr_ps, nr_ifgs)) * noise))
+        ph_patch = np.ones((nr_ps, nr_ifgs))
+
+        topofit_exhaustive = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit_exhaustive.ps_topofit_loop(ph, ph_patch, bperp, nr_trial_wraps)
+        topofit_coarse = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs,
+                                   search=PsTopofit.SEARCH_COARSE_TO_FINE)
+        topofit_coarse.ps_topofit_loop(ph, ph_patch, bperp, nr_trial_wraps)
+
+        np.testing.assert_array_equal(topofit_coarse.k_ps, topofit_exhaustive.k_ps)
+        np.testing.assert_array_equal(topofit_coarse.c_ps, topofit_exhaustive.c_ps)
+        np.testing.assert_array_equal(topofit_coarse.coh_ps, topofit_exhaustive.coh_ps)
+        np.testing.assert_array_equal(topofit_coarse.ph_res, topofit_exhaustive.ph_res)
+
+        # Non-uniform FFT finds exactly only trials near maximum
+        self.assertLess(topofit_exhaustive.nr_evaluated_trials, nr_ps * 161 / 2)
+        self.assertLess(topofit_coarse.nr_evaluated_trials, nr_ps * 161 / 2)
+
+    def test_ps_topofit_loop_nufft_same_as_dense(self):
+        """Non-uniform FFT search gives same results as dense search of all trials. Dense search
+        is forced by raising minimum number of trials for non-uniform FFT"""
+
+        random = np.random.RandomState(8)
+        nr_ps, nr_ifgs, nr_trial_wraps = 300, 30, 4
+        nr_trials = 2 * 8 * nr_trial_wraps + 1
+        bperp = random.uniform(-300, 300, (nr_ps, nr_ifgs))
+        # Wide baselines
+        bperp[:50] *= 20
+        k_ps = random.uniform(-1, 1, (nr_ps, 1)) * nr_trial_wraps * 2 * np.pi / np.ptp(
+            bperp, axis=1, keepdims=True)
+        ph = np.exp(1j * (k_ps * bperp + random.normal(0, 0.8, (nr_ps, nr_ifgs))))
+        # Amplitudes that differ, zero amplitude (zero weight) and NaN pixels
+        ph *= random.uniform(0.1, 2, (nr_ps, nr_ifgs))
+        ph[60, 3] = 0
+        ph[61] = 0
+        ph[62, 5] = np.nan
+        ph_patch = np.exp(1j * random.normal(0, 0.3, (nr_ps, nr_ifgs)))
+        ph_patch[63, 7] = 0
+        ifg_ind = np.arange(1, nr_ifgs)
+
+        topofit_nufft = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit_nufft.ps_topofit_loop(ph, ph_patch, bperp, nr_trial_wraps, ifg_ind)
+        with mock.patch.object(PsTopofit, '_PsTopofit__NUFFT_MIN_TRIALS', nr_trials + 1):
+            topofit_dense = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+            topofit_dense.ps_topofit_loop(ph, ph_patch, bperp, nr_trial_wraps, ifg_ind)
+
+        np.testing.assert_array_equal(topofit_nufft.n_opt, topofit_dense.n_opt)
+        np.testing.assert_array_equal(topofit_nufft.k_ps, topofit_dense.k_ps)
+        np.testing.assert_array_equal(topofit_nufft.c_ps, topofit_dense.c_ps)
+        np.testing.assert_array_equal(topofit_nufft.coh_ps, topofit_dense.coh_ps)
+        np.testing.assert_array_equal(topofit_nufft.ph_res, topofit_dense.ph_res)
+        for invalid_ind in (60, 61, 62, 63):
+            self.assertTrue(np.isnan(topofit_nufft.k_ps[invalid_ind, 0]))
+            self.assertEqual(topofit_nufft.coh_ps[invalid_ind, 0], 0)
+
+        nr_valid_ps = nr_ps - 4
+        self.assertEqual(topofit_dense.nr_evaluated_trials, nr_valid_ps * nr_trials)
+        self.assertGreaterEqual(topofit_nufft.nr_evaluated_trials, nr_valid_ps)
+        self.assertLess(topofit_nufft.nr_evaluated_trials, nr_valid_ps * nr_trials)
+
+    def test_ps_topofit_loop_single_precision_drift(self):
+        """Single precision results are compared to double precision results. With this synthetic
+        data coherence drifts about 1e-8, k_ps 1e-9 and ph_res 1e-7 (radians)"""
+
+        random = np.random.RandomState(5)
+        nr_ps, nr_ifgs = 500, 20
+        bperp = random.uniform(-150, 150, (nr_ps, nr_ifgs))
+        k_ps = random.uniform(-0.01, 0.01, (nr_ps, 1))
+        ph = np.exp(1j * (k_ps * bperp + random.normal(0, 0.6, (nr_ps, nr_ifgs)))).astype(
+            np.complex64)
+        ph_patch = np.exp(1j * random.normal(0, 0.3, (nr_ps, nr_ifgs))).astype(np.complex64)
+        ifg_ind = np.arange(nr_ifgs)
+
+        topofit_double = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs, DataTypes.PRECISION_DOUBLE)
+        topofit_double.ps_topofit_loop(ph, ph_patch, bperp, 0.8, ifg_ind)
+        topofit_single = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs, DataTypes.PRECISION_SINGLE)
+        topofit_single.ps_topofit_loop(ph, ph_patch, bperp, 0.8, ifg_ind)
+
+        self.assertEqual(topofit_single.ph_res.dtype, np.float32)
+        np.testing.assert_array_equal(topofit_single.n_opt, topofit_double.n_opt)
+        np.testing.assert_allclose(topofit_single.coh_ps, topofit_double.coh_ps, atol=1e-6)
+        np.testing.assert_allclose(topofit_single.k_ps, topofit_double.k_ps, atol=1e-7)
+
+        angle_drift = lambda single, double: np.abs(np.angle(np.exp(1j * (single - double))))
+        self.assertLess(np.max(angle_drift(topofit_single.c_ps, topofit_double.c_ps)), 1e-5)
+        self.assertLess(np.max(angle_drift(topofit_single.ph_res, topofit_double.ph_res)), 1e-5)
+
+    @skipUnless(PsTopofitKernel.IS_AVAILABLE, "numba is not installed")
+    def test_ps_topofit_loop_numba_engine(self):
+        random = np.random.RandomState(6)
+        nr_ps, nr_ifgs = 200, 18
+        bperp = random.uniform(-150, 150, (nr_ps, nr_ifgs))
+        ph = np.exp(1j * random.normal(0, 1, (nr_ps, nr_ifgs))).astype(np.complex64)
+        ph_patch = np.exp(1j * random.normal(0, 0.3, (nr_ps, nr_ifgs)))
+        ph[3, 1] = np.nan
+        ifg_ind = np.arange(1, nr_ifgs)
+
+        topofit_numpy = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs)
+        topofit_numpy.ps_topofit_loop(ph, ph_patch, bperp, 0.5, ifg_ind)
+        topofit_numba = PsTopofit((nr_ps, 1), nr_ps, nr_ifgs, engine=PsTopofit.ENGINE_NUMBA)
+        topofit_numba.ps_topofit_loop(ph, ph_patch, bperp, 0.5, ifg_ind)
+
+        np.testing.assert_array_equal(topofit_numba.n_opt, topofit_numpy.n_opt)
+        np.testing.assert_allclose(topofit_numba.k_ps, topofit_numpy.k_ps, atol=1e-12)
+        np.testing.assert_allclose(topofit_numba.c_ps, topofit_numpy.c_ps, atol=1e-12)
+        np.testing.assert_allclose(topofit_numba.coh_ps, topofit_numpy.coh_ps, atol=1e-12)
+        np.testing.assert_allclose(topofit_numba.ph_res, topofit_numpy.ph_res, atol=1e-12)
+
+    def test_benchmark(self):
+        results = PsTopofit.benchmark(3, nr_ps=200, nr_ifgs=20, repeat=1)
+
+        self.assertEqual(set(results), {"dense", PsTopofit.SEARCH_EXHAUSTIVE,
+                                        PsTopofit.SEARCH_COARSE_TO_FINE})
+        # 2 * 8 * 3 + 1 trials
+        self.assertEqual(results["dense"][1], 49)
+        self.assertLess(results[PsTopofit.SEARCH_EXHAUSTIVE][1], 49)
+        self.assertLess(results[PsTopofit.SEARCH_COARSE_TO_FINE][1], 49)
+        # Non-uniform FFT is used again after benchmark
+        self.assertEqual(PsTopofit._PsTopofit__NUFFT_MIN_TRIALS, 32)
+
+    def test_get_engine(self):
+        expected_numba_engine = PsTopofit.ENGINE_NUMBA if PsTopofitKernel.IS_AVAILABLE \
+            else PsTopofit.ENGINE_NUMPY
+
+        self.assertEqual(PsTopofit.ENGINE_NUMPY, PsTopofit.get_engine(PsTopofit.ENGINE_NUMPY))
+        self.assertEqual(expected_numba_engine, PsTopofit.get_engine(PsTopofit.ENGINE_NUMBA))
+        self.assertRaises(AttributeError, PsTopofit.get_engine, "cython")
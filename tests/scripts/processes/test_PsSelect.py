@@ -8,6 +8,7 @@ from scripts.processes.PsEstGamma import PsEstGamma
 from scripts.processes.PsFiles import PsFiles
 from scripts.processes.PsSelect import PsSelect
 from scripts.utils.ArrayUtils import ArrayUtils
+from scripts.utils.internal.DataTypes import DataTypes
 from tests.MetaTestCase import MetaTestCase
 
 
@@ -77,6 +78,28 @@ class TestPsSelect(MetaTestCase):
         np.testing.assert_array_equal(self._ps_select.coh_ps2, ps_select_loaded.coh_ps2)
         np.testing.assert_array_equal(self._ps_select.coh_thresh, ps_select_loaded.coh_thresh)
 
+    def test_start_process_single_precision_drift(self):
+        """Single precision results are compared to double precision results on reference
+        patch. Selected pixels must be the same. Tolerances are not measured on reference
+        patch"""
+        self.__fill_est_gamma_with_matlab_data()
+        self.__start_process()
+        ps_select_single = PsSelect(self._ps_files, self._est_gamma_process,
+                                    DataTypes.PRECISION_SINGLE)
+        ps_select_single.start_process()
+
+        np.testing.assert_array_equal(ps_select_single.coh_thresh_ind,
+                                      self._ps_select.coh_thresh_ind)
+        np.testing.assert_array_equal(ps_select_single.keep_ind, self._ps_select.keep_ind)
+        np.testing.assert_allclose(ps_select_single.ph_patch, self._ps_select.ph_patch,
+                                   atol=1e-4)
+        np.testing.assert_allclose(ps_select_single.k_ps, self._ps_select.k_ps, atol=1e-6)
+        np.testing.assert_allclose(ps_select_single.coh_ps2, self._ps_select.coh_ps2, atol=1e-4)
+
+        angle_drift = lambda single, double: np.abs(np.angle(np.exp(1j * (single - double))))
+        self.assertLess(np.max(angle_drift(ps_select_single.ph_res, self._ps_select.ph_res)),
+                        1e-3)
+
     def __start_process(self):
         self._ps_select = PsSelect(self._ps_files, self._est_gamma_process)
         self._ps_select.start_process()
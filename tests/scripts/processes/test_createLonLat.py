@@ -1,7 +1,14 @@
 import os
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
+
+import numpy as np
 import scipy.io
 
+from scripts.processes import CreateLonLat as CreateLonLatModule
 from scripts.processes.CreateLonLat import CreateLonLat
+from scripts.utils.internal.FolderConstants import FolderConstants
 from tests.MetaTestCase import MetaTestCase
 
 
@@ -37,6 +44,31 @@ class TestCreateLonLat(MetaTestCase):
             self.assertAlmostEqual(lonlat_expected[row_num, 1], lonlat_actual[row_num, 1],
                                    self._PLACES)
 
+    @skipUnless(CreateLonLatModule.ProductIO, "snappy is not installed")
+    def test_start_process_native_geo_reader(self):
+        process_snap = CreateLonLat(self._PATH_PATCH_FOLDER, self._GEO_DATA_FILE,
+                                    CreateLonLat.GEO_READER_SNAP)
+        process_snap.start_process()
+
+        process_native = CreateLonLat(self._PATH_PATCH_FOLDER, self._GEO_DATA_FILE,
+                                      CreateLonLat.GEO_READER_NATIVE)
+        process_native.start_process()
+
+        np.testing.assert_array_equal(process_native.pscands_ij, process_snap.pscands_ij)
+        np.testing.assert_array_equal(process_native.lonlat, process_snap.lonlat)
+
+    def test_start_process_no_candidates(self):
+        with tempfile.TemporaryDirectory() as path:
+            patch_folder = Path(path, FolderConstants.PATCH_FOLDER_NAME)
+            patch_folder.mkdir()
+            Path(patch_folder, "pscands.1.ij").touch()
+
+            process = CreateLonLat(path, self._GEO_DATA_FILE, CreateLonLat.GEO_READER_NATIVE)
+            process.start_process()
+
+        self.assertEqual(process.pscands_ij.shape, (0, 3))
+        self.assertEqual(process.lonlat.shape, (0, 2))
+
     def test_save_and_load_results(self):
         process_save = self.__start_process()
         process_save.save_results(self._SAVE_LOAD_PATH)
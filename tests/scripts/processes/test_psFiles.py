@@ -1,4 +1,5 @@
 import os
+import tempfile
 import scipy.io
 import h5py
 import numpy as np
@@ -122,6 +123,28 @@ class TestPsFiles(MetaTestCase):
         np.testing.assert_array_equal(ps_files_load.hgt, self._ps_files.hgt)
         np.testing.assert_array_equal(ps_files_load.ifg_dates, self._ps_files.ifg_dates)
 
+    def test_out_of_core_same_as_in_memory(self):
+        self.__start_process()
+
+        with tempfile.TemporaryDirectory() as store_path:
+            ps_files_out_of_core = PsFiles(self._PATH_PATCH_FOLDER, self.lonlat_process,
+                                           out_of_core=True, store_path=store_path)
+            ps_files_out_of_core.start_process()
+
+            self.assertIsInstance(ps_files_out_of_core.ph, np.memmap)
+            np.testing.assert_array_equal(ps_files_out_of_core.ph, self._ps_files.ph)
+            np.testing.assert_array_equal(ps_files_out_of_core.bperp, self._ps_files.bperp)
+            np.testing.assert_array_equal(ps_files_out_of_core.sort_ind, self._ps_files.sort_ind)
+            # Out-of-core bperp_meaned is sum of blocks, so it is summed in different order
+            np.testing.assert_allclose(ps_files_out_of_core.bperp_meaned,
+                                       self._ps_files.bperp_meaned, rtol=1e-12)
+
+            ph_blocks = [block for _, _, block in ps_files_out_of_core.iter_ph_blocks()]
+            np.testing.assert_array_equal(np.concatenate(ph_blocks), self._ps_files.ph)
+
+            # Memmaps must be closed before store folder is removed
+            del ps_files_out_of_core, ph_blocks
+
     def __start_process(self):
         self._ps_files = PsFiles(self._PATH_PATCH_FOLDER, self.lonlat_process)
         self._ps_files.start_process()
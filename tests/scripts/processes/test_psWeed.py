@@ -8,6 +8,7 @@ from scripts.processes.PsEstGamma import PsEstGamma
 from scripts.processes.PsFiles import PsFiles
 from scripts.processes.PsSelect import PsSelect
 from scripts.processes.PsWeed import PsWeed
+from scripts.utils.internal.DataTypes import DataTypes
 from tests.MetaTestCase import MetaTestCase
 
 
@@ -112,6 +113,27 @@ class TestPsWeed(MetaTestCase):
 
         np.testing.assert_array_almost_equal(sort_ind, la_mat['la'])
 
+    def test_start_process_single_precision_drift(self):
+        """Single precision results are compared to double precision results on reference
+        patch. Weeded pixels must be the same. Tolerances are not measured on reference
+        patch"""
+        self.__fill_est_gamma_with_matlab_data()
+        self.__start_process()
+        ps_weed_single = PsWeed(self._PATH_PATCH_FOLDER, self.__ps_files,
+                                self.__est_gamma_process, self.__ps_select,
+                                precision=DataTypes.PRECISION_SINGLE)
+        ps_weed_single.start_process()
+
+        np.testing.assert_array_equal(ps_weed_single.selectable_ps,
+                                      self.__ps_weed_process.selectable_ps)
+        np.testing.assert_array_equal(ps_weed_single.selectable_ps2,
+                                      self.__ps_weed_process.selectable_ps2)
+        np.testing.assert_array_equal(ps_weed_single.ifg_ind, self.__ps_weed_process.ifg_ind)
+        np.testing.assert_allclose(ps_weed_single.ps_std, self.__ps_weed_process.ps_std,
+                                   atol=1e-4)
+        np.testing.assert_allclose(ps_weed_single.ps_max, self.__ps_weed_process.ps_max,
+                                   atol=1e-4)
+
     def __start_process(self):
         self.__ps_weed_process = PsWeed(self._PATH_PATCH_FOLDER, self.__ps_files, self.__est_gamma_process, self.__ps_select)
         self.__ps_weed_process.start_process()
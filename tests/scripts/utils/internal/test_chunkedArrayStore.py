@@ -0,0 +1,34 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from scripts.utils.internal.ChunkedArrayStore import ChunkedArrayStore
+
+
+class TestChunkedArrayStore(TestCase):
+    def test_create_and_iter_blocks(self):
+        array = np.arange(20, dtype=np.complex64).reshape((10, 2))
+
+        with tempfile.TemporaryDirectory() as store_path:
+            store = ChunkedArrayStore(store_path, block_size=4)
+
+            created = store.create('array', array.shape, array.dtype)
+            created[:] = array
+            created.flush()
+            del created
+
+            self.assertTrue(store.exists('array'))
+            np.testing.assert_array_equal(store.open('array'), array)
+
+            blocks = [(start, end, block) for start, end, block in store.iter_blocks('array')]
+
+        self.assertEqual([(start, end) for start, end, _ in blocks], [(0, 4), (4, 8), (8, 10)])
+        np.testing.assert_array_equal(np.concatenate([block for _, _, block in blocks]), array)
+
+    def test_open_missing(self):
+        with tempfile.TemporaryDirectory() as store_path:
+            store = ChunkedArrayStore(store_path)
+
+            self.assertFalse(store.exists('array'))
+            self.assertRaises(FileNotFoundError, store.open, 'array')
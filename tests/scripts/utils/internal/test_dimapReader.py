@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from scripts.utils.internal.DimapReader import DimapReader
+from tests import TEST_RESOURCES_PATH
+
+
+class TestDimapReader(TestCase):
+    _GEO_DATA_FILE = os.path.join(TEST_RESOURCES_PATH,
+                                  'subset_8_of_S1A_IW_SLC__1SDV_20160614T043402_20160614T043429_011702_011EEA_F130_Stack_deb_ifg_Geo.dim')
+
+    def test_get_band(self):
+        dimap_reader = DimapReader(self._GEO_DATA_FILE)
+
+        lon_band = dimap_reader.get_band('lon_band')
+        lat_band = dimap_reader.get_band('lat_band')
+
+        # Values from lon_band.hdr
+        self.assertEqual(lon_band.shape, (557, 709))
+        self.assertEqual(lat_band.shape, (557, 709))
+        self.assertEqual(lon_band.dtype, np.dtype('>f8'))
+
+        # First pixels of lon_band.img and lat_band.img
+        self.assertAlmostEqual(lon_band[0, 0], 26.77024561, 7)
+        self.assertAlmostEqual(lat_band[0, 0], 58.41145301, 7)
+
+    def test_get_band_missing(self):
+        dimap_reader = DimapReader(self._GEO_DATA_FILE)
+
+        self.assertRaises(FileNotFoundError, dimap_reader.get_band, 'no_such_band')
+
+    def test_get_band_multi_band_file(self):
+        DIM_FILE_CONTENT = """<Dimap_Document>
+    <Data_Access>
+        <Data_File>
+            <DATA_FILE_PATH href="product.data/band.hdr" />
+            <BAND_INDEX>0</BAND_INDEX>
+        </Data_File>
+    </Data_Access>
+    <Image_Interpretation>
+        <Spectral_Band_Info>
+            <BAND_INDEX>0</BAND_INDEX>
+            <BAND_NAME>band</BAND_NAME>
+        </Spectral_Band_Info>
+    </Image_Interpretation>
+</Dimap_Document>"""
+        HEADER_CONTENT = "ENVI\nsamples = 2\nlines = 2\nbands = 3\ndata type = 4\n"
+
+        with tempfile.TemporaryDirectory() as product_path:
+            dim_file = os.path.join(product_path, 'product.dim')
+            with open(dim_file, 'w') as file:
+                file.write(DIM_FILE_CONTENT)
+            os.mkdir(os.path.join(product_path, 'product.data'))
+            with open(os.path.join(product_path, 'product.data', 'band.hdr'), 'w') as file:
+                file.write(HEADER_CONTENT)
+
+            dimap_reader = DimapReader(dim_file)
+
+            self.assertRaises(ValueError, dimap_reader.get_band, 'band')
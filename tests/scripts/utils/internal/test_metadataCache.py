@@ -0,0 +1,49 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from scripts.utils.internal.MetadataCache import MetadataCache
+
+
+class TestMetadataCache(TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.TemporaryDirectory()
+        self.__source_path = Path(self.__tmp_dir.name, "source.txt")
+        self.__source_path.write_text("1 2 3")
+
+        self.__cache = MetadataCache(os.path.join(self.__tmp_dir.name, "cache"))
+        self.__loader_calls = 0
+
+    def tearDown(self):
+        self.__tmp_dir.cleanup()
+
+    def __loader(self):
+        self.__loader_calls += 1
+        return {'values': np.loadtxt(str(self.__source_path)), 'name': "source"}
+
+    def test_get_uses_cache(self):
+        first = self.__cache.get("test", [self.__source_path], self.__loader)
+        second = self.__cache.get("test", [self.__source_path], self.__loader)
+
+        self.assertEqual(self.__loader_calls, 1)
+        np.testing.assert_array_equal(second['values'], first['values'])
+        self.assertEqual(second['name'], "source")
+
+    def test_get_source_changed(self):
+        self.__cache.get("test", [self.__source_path], self.__loader)
+
+        self.__source_path.write_text("1 2 3 4")
+        loaded = self.__cache.get("test", [self.__source_path], self.__loader)
+
+        self.assertEqual(self.__loader_calls, 2)
+        np.testing.assert_array_equal(loaded['values'], [1, 2, 3, 4])
+
+    def test_get_missing_source(self):
+        def loader():
+            raise FileNotFoundError("No source")
+
+        self.assertRaises(FileNotFoundError, self.__cache.get, "test",
+                          [Path(self.__tmp_dir.name, "missing.txt")], loader)
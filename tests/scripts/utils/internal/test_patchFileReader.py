@@ -0,0 +1,41 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from scripts.utils.internal.PatchFileReader import PatchFileReader
+
+
+class TestPatchFileReader(TestCase):
+    def test_load_pscands_ij(self):
+        with tempfile.TemporaryDirectory() as patch_path:
+            with Path(patch_path, "pscands.1.ij").open("w") as pscands_file:
+                pscands_file.write("1 2 3\n4 5 6\n7 8 9\n")
+
+            pscands_ij = PatchFileReader.load_pscands_ij(Path(patch_path))
+
+        self.assertEqual(pscands_ij.dtype, np.int32)
+        np.testing.assert_array_equal(pscands_ij, np.arange(1, 10).reshape((3, 3)))
+
+    def test_load_pscands_ij_no_file(self):
+        with tempfile.TemporaryDirectory() as patch_path:
+            self.assertRaises(FileNotFoundError, PatchFileReader.load_pscands_ij,
+                              Path(patch_path))
+
+    def test_load_ph(self):
+        nr_ifgs, nr_ps, master_nr = 3, 5, 2
+        ph_in_file = (np.arange(nr_ifgs * nr_ps) + 1j * np.arange(nr_ifgs * nr_ps)).reshape(
+            (nr_ifgs, nr_ps))
+        sort_ind = np.array([4, 0, 3, 1, 2])
+
+        with tempfile.TemporaryDirectory() as patch_path:
+            ph_in_file.astype('>c8').tofile(str(Path(patch_path, "pscands.1.ph")))
+
+            ph = PatchFileReader.load_ph(Path(patch_path), nr_ifgs, master_nr, sort_ind)
+
+        ph_expected = ph_in_file.transpose()[sort_ind]
+        ph_expected[:, master_nr - 1] = 1
+
+        self.assertEqual(ph.dtype, np.complex64)
+        np.testing.assert_array_equal(ph, ph_expected)
@@ -32,7 +32,9 @@ class TestMain(MetaTestCase):
 
         cls._PATH_PATCH_FOLDER = os.path.join(cls._PATH, PATCH_FOLDER)
 
-        cls._SAVE_LOAD_PATH = cls._config.get_default_section('save_load_path')
+        # Main saves every patch results to separate folder
+        cls._SAVE_LOAD_PATH = os.path.join(cls._config.get_default_section('save_load_path'),
+                                           FolderConstants.PATCH_FOLDER_NAME)
 
         cls.__logger = LoggerFactory.create("TestMain")
 
@@ -91,6 +93,9 @@ class TestMain(MetaTestCase):
     def __delete_saved_files(self, path, file_name=None):
         """This deletes all .npz files in path directory when file name is not showed."""
 
+        if not os.path.exists(path):
+            return
+
         self.__logger.info("Deleting .npz files in " + path)
         for file in os.listdir(path):
             file_path = os.path.join(path, file)